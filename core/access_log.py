@@ -0,0 +1,237 @@
+"""Structured access log written off the event loop.
+
+`AccessLogMiddleware` builds one JSON entry per HTTP request (route,
+user_id, status, bytes, duration and the timings of every upstream call
+made through the shared client). The entry is only put on a bounded queue
+on the loop; serialisation and writes happen in a listener thread that
+flushes in batches, to stdout or to a size-rotated file. Successful fast
+requests on high-volume routes are sampled (ACCESS_LOG_SAMPLE_RATES);
+errors and slow requests are always kept. When the queue is full entries
+are dropped and counted rather than blocking the request.
+"""
+import json
+import logging
+import queue
+import random
+import sys
+import time
+from contextvars import ContextVar
+from logging.handlers import QueueListener, RotatingFileHandler
+
+import httpx
+
+from .config import LazyObject, settings
+
+# Fraction of successful requests logged per path prefix (longest wins).
+SAMPLE_RATES = {
+    "/health": 0.01,
+    "/user/profiles": 0.1,
+}
+
+_entry: ContextVar[dict | None] = ContextVar("access_log_entry", default=None)
+
+
+def sample_rate(path: str) -> float:
+    rates = {**SAMPLE_RATES, **settings.ACCESS_LOG_SAMPLE_RATES}
+    matches = [prefix for prefix in rates if path.startswith(prefix)]
+    if not matches:
+        return 1.0
+    return rates[max(matches, key=len)]
+
+
+def annotate(**fields):
+    """Attach fields (e.g. user_id) to the current request's log entry."""
+    entry = _entry.get()
+    if entry is not None:
+        entry.update(fields)
+
+
+async def record_upstream_start(request: httpx.Request):
+    """httpx request hook: remember when the upstream call started."""
+    if _entry.get() is not None:
+        request.extensions["access_log_start"] = time.perf_counter()
+
+
+async def record_upstream_call(response: httpx.Response):
+    """httpx response hook: add the call's timing to the request's entry."""
+    entry = _entry.get()
+    request = response.request
+    started = request.extensions.get("access_log_start")
+    if entry is None or started is None:
+        return
+    entry["upstream"].append({
+        "service": request.url.host,
+        "method": request.method,
+        "path": request.url.path,
+        "status": response.status_code,
+        "ms": round((time.perf_counter() - started) * 1000, 1),
+    })
+
+
+class _JsonFormatter(logging.Formatter):
+
+    def format(self, record):
+        return json.dumps(record.msg, separators=(",", ":"), default=str)
+
+
+class _BatchedWrites:
+    """Handler mixin: write without flushing, flush every `batch_size` records.
+
+    The listener also flushes whenever its queue runs empty, so a quiet
+    gateway never holds entries back.
+    """
+    batch_size = 100
+    _pending = 0
+
+    def emit(self, record):
+        try:
+            self._before_write(record)
+            self.stream.write(self.format(record) + self.terminator)
+            self._pending += 1
+            if self._pending >= self.batch_size:
+                self.flush()
+        except Exception:
+            self.handleError(record)
+
+    def _before_write(self, record):
+        pass
+
+    def flush(self):
+        super().flush()
+        self._pending = 0
+
+
+class BatchedStreamHandler(_BatchedWrites, logging.StreamHandler):
+    pass
+
+
+class BatchedRotatingFileHandler(_BatchedWrites, RotatingFileHandler):
+
+    def _before_write(self, record):
+        if self.shouldRollover(record):
+            self.doRollover()
+        if self.stream is None:
+            self.stream = self._open()
+
+
+class _BatchingListener(QueueListener):
+
+    def enqueue_sentinel(self):
+        # Block instead of failing when the queue is full at shutdown.
+        self.queue.put(self._sentinel)
+
+    def dequeue(self, block):
+        try:
+            return self.queue.get_nowait()
+        except queue.Empty:
+            for handler in self.handlers:
+                handler.flush()
+            return self.queue.get(block)
+
+
+class AccessLog:
+
+    def __init__(self, path: str, max_bytes: int, backup_count: int, queue_size: int, batch_size: int):
+        if path:
+            handler = BatchedRotatingFileHandler(path, maxBytes=max_bytes, backupCount=backup_count, delay=True)
+        else:
+            handler = BatchedStreamHandler(sys.stdout)
+        handler.batch_size = batch_size
+        handler.setFormatter(_JsonFormatter())
+        self.queue: queue.Queue = queue.Queue(maxsize=queue_size)
+        self.listener = _BatchingListener(self.queue, handler)
+        self.dropped = 0
+        self._running = False
+
+    def start(self):
+        if not self._running:
+            self.listener.start()
+            self._running = True
+
+    def stop(self):
+        # Drains what is already queued, then flushes and closes the sink.
+        if self._running:
+            self.listener.stop()
+            self._running = False
+            for handler in self.listener.handlers:
+                handler.flush()
+                handler.close()
+
+    def write(self, entry: dict):
+        record = logging.makeLogRecord({"msg": entry, "levelno": logging.INFO, "levelname": "INFO"})
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class AccessLogMiddleware:
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not settings.ACCESS_LOG_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        entry = {
+            "ts": round(time.time(), 3),
+            "method": scope["method"],
+            "path": scope["path"],
+            "user_id": None,
+            "status": None,
+            "bytes_in": _content_length(scope),
+            "bytes_out": 0,
+            "upstream": [],
+        }
+        token = _entry.set(entry)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                entry["status"] = message["status"]
+            elif message["type"] == "http.response.body":
+                entry["bytes_out"] += len(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        except BaseException:
+            if entry["status"] is None:
+                entry["status"] = 500
+            raise
+        finally:
+            _entry.reset(token)
+            duration_ms = (time.perf_counter() - started) * 1000
+            entry["duration_ms"] = round(duration_ms, 1)
+            route = scope.get("route")
+            entry["route"] = getattr(route, "path", None)
+            _maybe_write(entry, duration_ms)
+
+
+def _content_length(scope) -> int:
+    for name, value in scope["headers"]:
+        if name == b"content-length":
+            return int(value) if value.isdigit() else 0
+    return 0
+
+
+def _maybe_write(entry: dict, duration_ms: float):
+    status = entry["status"] or 0
+    if status < 400 and duration_ms < settings.ACCESS_LOG_SLOW_MS:
+        rate = sample_rate(entry["path"])
+        if rate < 1.0:
+            if random.random() >= rate:
+                return
+            entry["sample_rate"] = rate
+    access_log.write(entry)
+
+
+access_log = LazyObject(lambda: AccessLog(
+    path=settings.ACCESS_LOG_FILE,
+    max_bytes=settings.ACCESS_LOG_MAX_BYTES,
+    backup_count=settings.ACCESS_LOG_BACKUP_COUNT,
+    queue_size=settings.ACCESS_LOG_QUEUE_SIZE,
+    batch_size=settings.ACCESS_LOG_BATCH_SIZE,
+))
@@ -0,0 +1,149 @@
+"""Admission control: bounded concurrency, priority queueing and load shedding.
+
+At most ADMISSION_MAX_IN_FLIGHT HTTP requests are processed at once. When
+the gateway is saturated, further requests wait in a priority queue (tier 0
+first) and the average queueing delay is tracked. Once that delay exceeds
+the tier's threshold, new low-priority requests are rejected right away
+with 503 + Retry-After instead of piling up behind the important flows.
+"""
+import asyncio
+import heapq
+import itertools
+import json
+import math
+import time
+
+from .config import settings
+
+TIER_CRITICAL = 0
+TIER_NORMAL = 1
+TIER_LOW = 2
+
+# Longest matching prefix wins; anything else is TIER_NORMAL. HTTP only:
+# WebSockets bypass admission entirely (see AdmissionMiddleware).
+ROUTE_PRIORITIES = {
+    "/auth/": TIER_CRITICAL,
+    "/health": TIER_CRITICAL,
+    "/user/profiles": TIER_LOW,
+    "/user/profiles/random": TIER_NORMAL,
+    "/matching/connections": TIER_LOW,
+}
+
+# Shed a tier once the queueing delay exceeds target * factor (None = never).
+SHED_FACTORS = {TIER_CRITICAL: None, TIER_NORMAL: 4.0, TIER_LOW: 1.0}
+
+
+def route_priority(path: str) -> int:
+    matches = [prefix for prefix in ROUTE_PRIORITIES if path.startswith(prefix)]
+    if not matches:
+        return TIER_NORMAL
+    return ROUTE_PRIORITIES[max(matches, key=len)]
+
+
+class Overloaded(Exception):
+    def __init__(self, retry_after: int):
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+
+    def __init__(self, max_in_flight: int, target_delay: float, max_wait: float):
+        self.max_in_flight = max_in_flight
+        self.target_delay = target_delay
+        self.max_wait = max_wait
+        self.in_flight = 0
+        self.queue_delay = 0.0  # EWMA of the time admitted requests spent queued
+        self._waiters: list[tuple[int, int, asyncio.Future]] = []
+        self._seq = itertools.count()
+
+    def _record_wait(self, seconds: float):
+        self.queue_delay = 0.8 * self.queue_delay + 0.2 * seconds
+
+    def _retry_after(self) -> int:
+        return max(1, math.ceil(self.queue_delay * 2))
+
+    async def acquire(self, tier: int):
+        while self._waiters and self._waiters[0][2].done():
+            heapq.heappop(self._waiters)
+
+        if self.in_flight < self.max_in_flight and not self._waiters:
+            self.in_flight += 1
+            self._record_wait(0.0)
+            return
+
+        factor = SHED_FACTORS.get(tier)
+        if factor is not None and self.queue_delay > self.target_delay * factor:
+            raise Overloaded(self._retry_after())
+
+        future = asyncio.get_running_loop().create_future()
+        entry = (tier, next(self._seq), future)
+        heapq.heappush(self._waiters, entry)
+        queued_at = time.monotonic()
+        try:
+            await asyncio.wait_for(asyncio.shield(future), timeout=self.max_wait)
+        except asyncio.TimeoutError:
+            if future.done() and not future.cancelled():
+                # Admitted at the last moment; keep the slot.
+                self._record_wait(time.monotonic() - queued_at)
+                return
+            future.cancel()
+            self._record_wait(time.monotonic() - queued_at)
+            raise Overloaded(self._retry_after())
+        except BaseException:
+            if future.done() and not future.cancelled():
+                self.release()
+            else:
+                future.cancel()
+            raise
+        self._record_wait(time.monotonic() - queued_at)
+
+    def release(self):
+        # Hand the slot straight to the most important live waiter.
+        while self._waiters:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                future.set_result(None)
+                return
+        self.in_flight -= 1
+
+
+class AdmissionMiddleware:
+
+    def __init__(self, app):
+        self.app = app
+        self.controller = AdmissionController(
+            max_in_flight=settings.ADMISSION_MAX_IN_FLIGHT,
+            target_delay=settings.ADMISSION_TARGET_QUEUE_DELAY,
+            max_wait=settings.ADMISSION_MAX_QUEUE_WAIT,
+        )
+
+    async def __call__(self, scope, receive, send):
+        # WebSockets are long-lived relays: they are never queued or shed.
+        if scope["type"] != "http" or not settings.ADMISSION_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        try:
+            await self.controller.acquire(route_priority(scope["path"]))
+        except Overloaded as e:
+            await _send_overloaded(send, e.retry_after)
+            return
+
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.controller.release()
+
+
+async def _send_overloaded(send, retry_after: int):
+    body = json.dumps({"detail": "Gateway overloaded, please retry later"}).encode()
+    await send({
+        "type": "http.response.start",
+        "status": 503,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+            (b"retry-after", str(retry_after).encode()),
+        ],
+    })
+    await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,135 @@
+"""Response compression (brotli/gzip) negotiated from Accept-Encoding."""
+import zlib
+
+try:
+    import brotli
+except ImportError:  # brotli is optional; gzip is always available
+    brotli = None
+
+from .config import settings
+
+COMPRESSIBLE_TYPES = ("application/json", "text/", "application/javascript")
+
+
+def _choose_encoding(accept_encoding: str) -> str | None:
+    offered = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        if name:
+            offered[name.strip().lower()] = q
+
+    if brotli is not None and offered.get("br", 0) > 0:
+        return "br"
+    if offered.get("gzip", 0) > 0:
+        return "gzip"
+    return None
+
+
+class _Compressor:
+
+    def __init__(self, encoding: str):
+        self.encoding = encoding
+        if encoding == "br":
+            self._impl = brotli.Compressor(quality=settings.BROTLI_QUALITY)
+        else:
+            self._impl = zlib.compressobj(settings.GZIP_LEVEL, zlib.DEFLATED, 31)
+
+    def chunk(self, data: bytes) -> bytes:
+        """Compress and flush, so each streamed chunk reaches the client promptly."""
+        if self.encoding == "br":
+            return self._impl.process(data) + self._impl.flush()
+        return self._impl.compress(data) + self._impl.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self, data: bytes = b"") -> bytes:
+        if self.encoding == "br":
+            return self._impl.process(data) + self._impl.finish()
+        return self._impl.compress(data) + self._impl.flush()
+
+
+class CompressionMiddleware:
+    """Compress responses of the proxy routers above a size threshold.
+
+    Single-chunk responses are compressed in one go and get an exact
+    Content-Length; streamed responses are compressed chunk by chunk.
+    """
+
+    def __init__(self, app, path_prefixes: tuple[str, ...]):
+        self.app = app
+        self.path_prefixes = path_prefixes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not scope["path"].startswith(self.path_prefixes):
+            await self.app(scope, receive, send)
+            return
+
+        accept_encoding = ""
+        for name, value in scope.get("headers", []):
+            if name == b"accept-encoding":
+                accept_encoding = value.decode("latin-1")
+        encoding = _choose_encoding(accept_encoding)
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start_message = None
+        compressor = None
+        passthrough = False
+
+        async def wrapped_send(message):
+            nonlocal start_message, compressor, passthrough
+
+            if message["type"] == "http.response.start":
+                start_message = message
+                return
+            if message["type"] != "http.response.body" or passthrough:
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+
+            if compressor is None:
+                headers = {k.lower(): v for k, v in start_message.get("headers", [])}
+                content_type = headers.get(b"content-type", b"").decode("latin-1")
+                skip = (
+                    b"content-encoding" in headers
+                    or not content_type.startswith(COMPRESSIBLE_TYPES)
+                    or start_message["status"] < 200
+                    or start_message["status"] in (204, 304)
+                    or (not more_body and len(body) < settings.COMPRESSION_MIN_SIZE)
+                )
+                if skip:
+                    passthrough = True
+                    await send(start_message)
+                    await send(message)
+                    return
+
+                compressor = _Compressor(encoding)
+                vary = [v for k, v in start_message.get("headers", []) if k.lower() == b"vary"]
+                new_headers = [
+                    (k, v) for k, v in start_message.get("headers", [])
+                    if k.lower() not in (b"content-length", b"vary")
+                ]
+                new_headers.append((b"content-encoding", encoding.encode()))
+                new_headers.append((b"vary", b", ".join(vary + [b"Accept-Encoding"])))
+                if not more_body:
+                    compressed = compressor.finish(body)
+                    new_headers.append((b"content-length", str(len(compressed)).encode()))
+                    await send({**start_message, "headers": new_headers})
+                    await send({"type": "http.response.body", "body": compressed})
+                    return
+                await send({**start_message, "headers": new_headers})
+
+            if more_body:
+                await send({"type": "http.response.body", "body": compressor.chunk(body), "more_body": True})
+            else:
+                await send({"type": "http.response.body", "body": compressor.finish(body)})
+
+        await self.app(scope, receive, wrapped_send)
@@ -1,3 +1,5 @@
+from functools import lru_cache
+
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 class Settings(BaseSettings):
@@ -7,6 +9,173 @@ class Settings(BaseSettings):
     CHAT_SERVICE_URL: str
     SECRET_KEY: str
 
+    # HTTP/2 (and HTTP/3 with TLS) serving through serve.py / Hypercorn
+    SERVE_BIND: list[str] = ["0.0.0.0:8000"]
+    SERVE_QUIC_BIND: list[str] = []
+    SERVE_CERTFILE: str | None = None
+    SERVE_KEYFILE: str | None = None
+    SERVE_KEEP_ALIVE_TIMEOUT: float = 65.0
+    SERVE_KEEP_ALIVE_MAX_REQUESTS: int = 10000
+    SERVE_GRACEFUL_TIMEOUT: float = 10.0
+    SERVE_H2_MAX_CONCURRENT_STREAMS: int = 100
+    SERVE_H2_MAX_INBOUND_FRAME_SIZE: int = 16384
+    CONNECTION_METRICS_IDLE: float = 70.0
+    CONNECTION_METRICS_MAX_TRACKED: int = 50000
+
+    # Startup warm-up
+    WARMUP_ENABLED: bool = True
+    WARMUP_CONNECTIONS: int = 2
+    WARMUP_TIMEOUT: float = 2.0
+
+    # Token verification (HS256 uses SECRET_KEY, RS256/ES256 use the JWKS)
+    JWT_ALGORITHMS: list[str] = ["HS256"]
+    JWKS_URL: str | None = None
+    JWKS_FILE: str | None = None
+    JWKS_REFRESH_INTERVAL: float = 300.0
+    JWT_VERIFY_WORKERS: int = 4
+
+    # Traffic capture for scripts/replay.py and shadow reads (core/traffic.py)
+    CAPTURE_ENABLED: bool = False
+    CAPTURE_FILE: str = "traffic.jsonl"
+    CAPTURE_SAMPLE_RATE: float = 0.01
+    CAPTURE_MAX_BODY: int = 64 * 1024
+    SHADOW_UPSTREAMS: dict[str, str] = {}
+    SHADOW_SAMPLE_RATE: float = 0.05
+    SHADOW_MAX_IN_FLIGHT: int = 50
+    SHADOW_TIMEOUT: float = 5.0
+    SHADOW_MAX_BODY: int = 1024 * 1024
+
+    # Service discovery / client-side load balancing (see core/discovery.py)
+    SERVICE_ENDPOINTS: dict[str, list[str]] = {}
+    SERVICE_ENDPOINTS_FILE: str | None = None
+    SERVICE_SRV_RECORDS: dict[str, str] = {}
+    DISCOVERY_REFRESH_INTERVAL: float = 10.0
+    LB_STRATEGY: str = "p2c"
+    LB_STRATEGIES: dict[str, str] = {}
+    OUTLIER_CONSECUTIVE_FAILURES: int = 5
+    OUTLIER_BASE_EJECTION_TIME: float = 30.0
+    OUTLIER_MAX_EJECTION_TIME: float = 300.0
+    OUTLIER_MAX_EJECTED_RATIO: float = 0.5
+
+    # Admission control / load shedding (see core/admission.py for the tiers)
+    ADMISSION_ENABLED: bool = True
+    ADMISSION_MAX_IN_FLIGHT: int = 200
+    ADMISSION_TARGET_QUEUE_DELAY: float = 0.1
+    ADMISSION_MAX_QUEUE_WAIT: float = 5.0
+
+    # Outbox for deferred follow-up calls (SQLite, see core/outbox.py)
+    OUTBOX_DB_PATH: str = "outbox.sqlite3"
+    OUTBOX_POLL_INTERVAL: float = 5.0
+    OUTBOX_BATCH_SIZE: int = 50
+    OUTBOX_BASE_BACKOFF: float = 1.0
+    OUTBOX_MAX_BACKOFF: float = 300.0
+    OUTBOX_MAX_ATTEMPTS: int = 20
+    COMPLETE_PROFILE_TOKEN_WAIT: float = 3.0
+
+    # Asynchronous submission of pass swipes (see core/swipe_buffer.py)
+    SWIPE_ASYNC_ENABLED: bool = False
+    SWIPE_BUFFER_MAX_PER_USER: int = 50
+    SWIPE_BATCH_SIZE: int = 10
+    SWIPE_FLUSH_INTERVAL: float = 1.0
+    SWIPE_FLUSH_CONCURRENCY: int = 20
+
+    # Structured access log (see core/access_log.py); empty file = stdout
+    ACCESS_LOG_ENABLED: bool = True
+    ACCESS_LOG_FILE: str = ""
+    ACCESS_LOG_MAX_BYTES: int = 50 * 1024 * 1024
+    ACCESS_LOG_BACKUP_COUNT: int = 5
+    ACCESS_LOG_QUEUE_SIZE: int = 10000
+    ACCESS_LOG_BATCH_SIZE: int = 100
+    ACCESS_LOG_SAMPLE_RATES: dict[str, float] = {}
+    ACCESS_LOG_SLOW_MS: float = 1000.0
+
+    # Request deadlines (see core/deadline.py for the per-route defaults)
+    DEFAULT_ROUTE_TIMEOUT: float = 10.0
+    ROUTE_TIMEOUTS: dict[str, float] = {}
+    UPSTREAM_WS_CONNECT_TIMEOUT: float = 10.0
+
+    # Shared upstream chat sockets for multi-device users (core/ws_fanin.py)
+    WS_CLIENT_QUEUE_SIZE: int = 256
+    WS_FANIN_LINGER: float = 5.0
+
+    # Relationship state cache (see core/relationship_cache.py)
+    RELATIONSHIP_CACHE_TTL: float = 30.0
+    RELATIONSHIP_CACHE_NEGATIVE_TTL: float = 5.0
+    RELATIONSHIP_CACHE_MAX_ENTRIES: int = 20000
+
+    # Excluded users kept at the gateway (see core/exclusions.py);
+    # "delta-varint" needs a matching service that reads excluded_ids_encoded
+    EXCLUSION_RECONCILE_INTERVAL: float = 300.0
+    EXCLUSION_CACHE_MAX_USERS: int = 10000
+    EXCLUDED_IDS_ENCODING: str = "json"
+
+    # Recent-messages cache (page 1 of each chat)
+    MESSAGE_CACHE_MAX_CHATS: int = 5000
+    MESSAGE_CACHE_MAX_PER_CHAT: int = 100
+    MESSAGE_CACHE_TTL: float = 60.0
+
+    # Per-route validation of upstream payloads (see core/models.py)
+    VALIDATION_MODES: dict[str, str] = {}
+
+    # Upstream response size limits (see core/json_stream.py for the per-path table)
+    UPSTREAM_MAX_RESPONSE_BYTES: int = 10 * 1024 * 1024
+    UPSTREAM_RESPONSE_LIMITS: dict[str, int] = {}
+
+    # Response compression
+    COMPRESSION_MIN_SIZE: int = 1024
+    GZIP_LEVEL: int = 6
+    BROTLI_QUALITY: int = 4
+
+    # Profile lookups used to enrich aggregated responses (chat inbox)
+    PROFILE_CACHE_TTL: float = 60.0
+    PROFILE_CACHE_MAX_ENTRIES: int = 10000
+    PROFILE_LOOKUP_CONCURRENCY: int = 20
+    PROFILE_LOOKUP_TIMEOUT: float = 2.0
+
+    # Retries / hedging for idempotent upstream GETs
+    RETRY_MAX_ATTEMPTS: int = 3
+    RETRY_BASE_DELAY: float = 0.05
+    RETRY_MAX_DELAY: float = 1.0
+    RETRY_DEADLINE: float = 5.0
+    RETRY_BUDGET_RATIO: float = 0.1
+    RETRY_BUDGET_MAX_TOKENS: float = 20.0
+    HEDGE_ENABLED: bool = True
+    HEDGE_MIN_SAMPLES: int = 20
+    HEDGE_MIN_DELAY: float = 0.01
+
     model_config = SettingsConfigDict(env_file=".env", extra='ignore')
 
-settings = Settings()
\ No newline at end of file
+
+
+@lru_cache
+def get_settings() -> Settings:
+    return Settings()
+
+
+class LazyObject:
+    """Proxy that builds the wrapped object on first attribute access.
+
+    Lets modules expose ready-to-use singletons (`settings`, caches, clients)
+    without reading the environment at import time.
+    """
+
+    def __init__(self, factory):
+        object.__setattr__(self, "_factory", factory)
+        object.__setattr__(self, "_instance", None)
+
+    def _resolve(self):
+        instance = object.__getattribute__(self, "_instance")
+        if instance is None:
+            instance = object.__getattribute__(self, "_factory")()
+            object.__setattr__(self, "_instance", instance)
+        return instance
+
+    def __getattr__(self, name):
+        return getattr(self._resolve(), name)
+
+    def __setattr__(self, name, value):
+        setattr(self._resolve(), name, value)
+
+
+settings = LazyObject(get_settings)
+
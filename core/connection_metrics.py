@@ -0,0 +1,114 @@
+"""Client connection reuse metrics (served at /health/connections).
+
+ASGI does not expose connection ids, so a connection is identified by the
+client's (host, port), which is unique per open TCP/QUIC connection. A key
+not seen for CONNECTION_METRICS_IDLE seconds is considered closed; the
+next request from it counts as a new connection. Per HTTP version this
+tracks requests, connections, how many requests reused a connection and
+the peak number of concurrent requests (streams) on one connection.
+"""
+import time
+from collections import OrderedDict
+
+from .config import LazyObject, settings
+
+
+class _Version:
+    __slots__ = ("requests", "connections", "reused", "max_streams")
+
+    def __init__(self):
+        self.requests = 0
+        self.connections = 0
+        self.reused = 0
+        self.max_streams = 0
+
+
+class _Connection:
+    __slots__ = ("version", "last_seen", "requests", "in_flight")
+
+    def __init__(self, version: str):
+        self.version = version
+        self.last_seen = time.monotonic()
+        self.requests = 0
+        self.in_flight = 0
+
+
+class ConnectionMetrics:
+
+    def __init__(self, idle: float, max_tracked: int):
+        self.idle = idle
+        self.max_tracked = max_tracked
+        self._connections: OrderedDict[tuple, _Connection] = OrderedDict()
+        self._versions: dict[str, _Version] = {}
+
+    def _expire(self, now: float):
+        while self._connections:
+            key, conn = next(iter(self._connections.items()))
+            if conn.in_flight or now - conn.last_seen < self.idle:
+                if len(self._connections) <= self.max_tracked:
+                    break
+            self._connections.popitem(last=False)
+
+    def started(self, key: tuple, version: str) -> _Connection:
+        now = time.monotonic()
+        self._expire(now)
+        stats = self._versions.setdefault(version, _Version())
+        conn = self._connections.get(key)
+        if conn is None:
+            conn = self._connections[key] = _Connection(version)
+            stats.connections += 1
+        else:
+            stats.reused += 1
+            self._connections.move_to_end(key)
+        conn.last_seen = now
+        conn.requests += 1
+        conn.in_flight += 1
+        stats.requests += 1
+        stats.max_streams = max(stats.max_streams, conn.in_flight)
+        return conn
+
+    def finished(self, conn: _Connection):
+        conn.in_flight -= 1
+        conn.last_seen = time.monotonic()
+
+    def report(self) -> dict:
+        self._expire(time.monotonic())
+        open_by_version: dict[str, int] = {}
+        for conn in self._connections.values():
+            open_by_version[conn.version] = open_by_version.get(conn.version, 0) + 1
+        report = {}
+        for version, stats in self._versions.items():
+            report[f"HTTP/{version}"] = {
+                "requests": stats.requests,
+                "connections": stats.connections,
+                "reused_requests": stats.reused,
+                "reuse_ratio": round(stats.reused / stats.requests, 3) if stats.requests else 0.0,
+                "requests_per_connection": round(stats.requests / stats.connections, 2) if stats.connections else 0.0,
+                "max_concurrent_streams": stats.max_streams,
+                "open_connections": open_by_version.get(version, 0),
+            }
+        return report
+
+
+connection_metrics = LazyObject(lambda: ConnectionMetrics(
+    idle=settings.CONNECTION_METRICS_IDLE,
+    max_tracked=settings.CONNECTION_METRICS_MAX_TRACKED,
+))
+
+
+class ConnectionMetricsMiddleware:
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        client = scope.get("client")
+        if scope["type"] != "http" or not client:
+            await self.app(scope, receive, send)
+            return
+
+        conn = connection_metrics.started(tuple(client), scope.get("http_version", "1.1"))
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            connection_metrics.finished(conn)
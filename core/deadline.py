@@ -0,0 +1,204 @@
+"""Per-route deadlines propagated to every upstream call of a request.
+
+`DeadlineMiddleware` gives each HTTP request a time budget (configured
+centrally in ROUTE_BUDGETS / settings.ROUTE_TIMEOUTS). Calls made through
+the shared client get at most the remaining budget as their timeout and
+forward it to the upstream in the DEADLINE_HEADER, so chained calls inside
+one handler share a single budget instead of each getting a fresh timeout.
+Handlers are cancelled when the budget runs out. A client disconnect only
+cancels reads (CANCEL_ON_DISCONNECT_METHODS): a write may already have been
+committed upstream, so it keeps running until its own deadline.
+"""
+import asyncio
+import json
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+import httpx
+
+from .config import settings
+
+DEADLINE_HEADER = "X-Deadline-Ms"
+
+# Longest matching path prefix wins; anything else gets DEFAULT_ROUTE_TIMEOUT.
+ROUTE_BUDGETS = {
+    "/auth/": 30.0,
+    "/user/complete_profile": 30.0,
+    "/user/account": 30.0,
+    "/user/profile/upload-image": 30.0,
+    "/matching/potential": 20.0,
+    "/matching/dismatch": 20.0,
+    "/matching/connections": 20.0,
+}
+
+CANCEL_ON_DISCONNECT_METHODS = {"GET", "HEAD"}
+
+_deadline: ContextVar[float | None] = ContextVar("deadline", default=None)
+
+
+class DeadlineExceeded(Exception):
+    pass
+
+
+def route_budget(path: str) -> float:
+    budgets = {**ROUTE_BUDGETS, **settings.ROUTE_TIMEOUTS}
+    matches = [prefix for prefix in budgets if path.startswith(prefix)]
+    if not matches:
+        return settings.DEFAULT_ROUTE_TIMEOUT
+    return budgets[max(matches, key=len)]
+
+
+@contextmanager
+def scoped_deadline(budget: float):
+    """Give the upstream calls made inside the block `budget` seconds in total."""
+    token = _deadline.set(time.monotonic() + budget)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def remaining() -> float | None:
+    """Seconds left for the current request, or None outside a request."""
+    deadline = _deadline.get()
+    if deadline is None:
+        return None
+    return deadline - time.monotonic()
+
+
+async def apply_deadline(request: httpx.Request):
+    """httpx request hook: clamp the timeout and forward the remaining budget."""
+    left = remaining()
+    if left is None:
+        return
+    if left <= 0:
+        raise DeadlineExceeded()
+
+    timeout = request.extensions.get("timeout", {})
+    request.extensions["timeout"] = {
+        key: left if value is None else min(value, left)
+        for key, value in {k: timeout.get(k) for k in ("connect", "read", "write", "pool")}.items()
+    }
+    request.headers[DEADLINE_HEADER] = str(int(left * 1000))
+
+
+def _incoming_budget(scope) -> float | None:
+    for name, value in scope.get("headers", []):
+        if name.decode("latin-1").lower() == DEADLINE_HEADER.lower():
+            try:
+                return max(0.0, int(value) / 1000)
+            except ValueError:
+                return None
+    return None
+
+
+def _expects_body(scope) -> bool:
+    for name, value in scope.get("headers", []):
+        name = name.decode("latin-1").lower()
+        if name == "transfer-encoding" or (name == "content-length" and value != b"0"):
+            return True
+    return False
+
+
+class DeadlineMiddleware:
+    """ASGI middleware enforcing the route budget and cancelling on disconnect."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        budget = route_budget(scope["path"])
+        client_budget = _incoming_budget(scope)
+        if client_budget is not None:
+            budget = min(budget, client_budget)
+        token = _deadline.set(time.monotonic() + budget)
+
+        body_done = False
+        disconnect_watcher = None
+        watcher_ready = asyncio.get_running_loop().create_future()
+        response_started = False
+
+        async def watch_disconnect():
+            while True:
+                message = await receive()
+                if message["type"] == "http.disconnect":
+                    return message
+
+        async def wrapped_receive():
+            nonlocal body_done, disconnect_watcher, empty_body_pending
+            if empty_body_pending:
+                empty_body_pending = False
+                return {"type": "http.request", "body": b"", "more_body": False}
+            if body_done:
+                # The body is consumed; further reads can only be a disconnect.
+                return await asyncio.shield(disconnect_watcher)
+            message = await receive()
+            if message["type"] == "http.request" and not message.get("more_body", False):
+                body_done = True
+                disconnect_watcher = asyncio.ensure_future(watch_disconnect())
+                watcher_ready.set_result(None)
+            return message
+
+        async def wrapped_send(message):
+            nonlocal response_started
+            if message["type"] == "http.response.start":
+                response_started = True
+            await send(message)
+
+        # Requests without a body (most GETs) can be watched right away; the
+        # watcher swallows the empty http.request and the handler gets a copy.
+        empty_body_pending = not _expects_body(scope)
+        if empty_body_pending:
+            body_done = True
+            disconnect_watcher = asyncio.ensure_future(watch_disconnect())
+            watcher_ready.set_result(None)
+
+        cancel_on_disconnect = scope["method"] in CANCEL_ON_DISCONNECT_METHODS
+        handler = asyncio.ensure_future(self.app(scope, wrapped_receive, wrapped_send))
+        try:
+            while True:
+                waiting = {handler}
+                if cancel_on_disconnect:
+                    waiting.add(disconnect_watcher or watcher_ready)
+                done, _ = await asyncio.wait(
+                    waiting,
+                    timeout=max(0.0, remaining() or 0.0),
+                    return_when=asyncio.FIRST_COMPLETED,
+                )
+                if handler in done:
+                    handler.result()
+                    return
+                if disconnect_watcher is not None and disconnect_watcher in done:
+                    # Client went away: nobody is waiting for this answer.
+                    handler.cancel()
+                    await asyncio.gather(handler, return_exceptions=True)
+                    return
+                if remaining() <= 0:
+                    handler.cancel()
+                    await asyncio.gather(handler, return_exceptions=True)
+                    if not response_started:
+                        await _send_timeout(send)
+                    return
+                # Otherwise the body just finished arriving: start watching for disconnects.
+        except DeadlineExceeded:
+            if not response_started:
+                await _send_timeout(send)
+        finally:
+            if disconnect_watcher is not None:
+                disconnect_watcher.cancel()
+            _deadline.reset(token)
+
+
+async def _send_timeout(send):
+    body = json.dumps({"detail": "Gateway timeout: request deadline exceeded"}).encode()
+    await send({
+        "type": "http.response.start",
+        "status": 504,
+        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+    })
+    await send({"type": "http.response.body", "body": body})
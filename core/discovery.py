@@ -0,0 +1,299 @@
+"""Upstream service discovery and client-side load balancing.
+
+The configured *_SERVICE_URL values stay the logical address of each
+service. `BalancingTransport` (installed on the shared client) rewrites a
+request aimed at one of them to a concrete endpoint picked by the
+service's strategy, so the routers keep building URLs as before. A request
+belongs to the service whose base URL (origin plus path prefix) is the
+longest match, so several services may share one host behind path
+prefixes; only the origin is rewritten.
+
+Endpoints come from the configured URL, SERVICE_ENDPOINTS (static),
+SERVICE_ENDPOINTS_FILE (JSON {service: [urls]}, re-read when it changes)
+and SERVICE_SRV_RECORDS (DNS SRV, needs dnspython). Endpoints that fail
+OUTLIER_CONSECUTIVE_FAILURES times in a row are ejected for a while, longer
+each time until they stay healthy for OUTLIER_MAX_EJECTION_TIME (passive
+outlier detection); `pick_sticky` keeps every WebSocket of one
+relationship on the same chat instance.
+"""
+import asyncio
+import hashlib
+import itertools
+import json
+import logging
+import os
+import random
+import time
+from dataclasses import dataclass
+
+import httpx
+
+try:
+    import dns.asyncresolver
+except ImportError:  # dnspython is optional; only needed for SRV records
+    dns = None
+
+from .config import LazyObject, settings
+
+logger = logging.getLogger("uvicorn.error")
+
+ROUND_ROBIN = "round_robin"
+LEAST_OUTSTANDING = "least_outstanding"
+POWER_OF_TWO = "p2c"
+
+# Upstream statuses that count as a failure of the endpoint itself.
+FAILURE_STATUSES = {502, 503, 504}
+
+
+def service_urls() -> dict[str, str]:
+    return {
+        "auth": settings.AUTH_SERVICE_URL,
+        "user": settings.USER_SERVICE_URL,
+        "matching": settings.MATCHING_SERVICE_URL,
+        "chat": settings.CHAT_SERVICE_URL,
+    }
+
+
+def _origin(url: httpx.URL) -> tuple[str, str, int | None]:
+    return url.scheme, url.host, url.port
+
+
+def _base_path(url: httpx.URL) -> str:
+    return url.path.rstrip("/")
+
+
+@dataclass(slots=True, eq=False)
+class Endpoint:
+    url: httpx.URL
+    outstanding: int = 0
+    consecutive_failures: int = 0
+    ejections: int = 0
+    ejected_until: float = 0.0
+
+    @property
+    def ejected(self) -> bool:
+        return self.ejected_until > time.monotonic()
+
+    def succeeded(self):
+        self.consecutive_failures = 0
+
+    def failed(self):
+        self.consecutive_failures += 1
+        if self.consecutive_failures >= settings.OUTLIER_CONSECUTIVE_FAILURES:
+            now = time.monotonic()
+            if now - self.ejected_until > settings.OUTLIER_MAX_EJECTION_TIME:
+                # Healthy for a long while since the last ejection: back-off starts over.
+                self.ejections = 0
+            self.ejections += 1
+            self.consecutive_failures = 0
+            ejection = min(
+                settings.OUTLIER_BASE_EJECTION_TIME * self.ejections,
+                settings.OUTLIER_MAX_EJECTION_TIME,
+            )
+            self.ejected_until = now + ejection
+            logger.warning("Ejected upstream endpoint %s for %.0fs", self.url, ejection)
+
+
+class Service:
+
+    def __init__(self, name: str, base_url: str, strategy: str):
+        self.name = name
+        self.base_url = httpx.URL(base_url)
+        self.strategy = strategy
+        self.endpoints: list[Endpoint] = [Endpoint(self.base_url)]
+        self._rr = itertools.count()
+
+    def set_endpoints(self, urls: list[str]):
+        # Keep the counters of endpoints that are still listed.
+        current = {str(e.url): e for e in self.endpoints}
+        endpoints = [current.get(url) or Endpoint(httpx.URL(url)) for url in dict.fromkeys(urls)]
+        if not endpoints:
+            endpoints = [current.get(str(self.base_url)) or Endpoint(self.base_url)]
+        self.endpoints = endpoints
+
+    def healthy(self) -> list[Endpoint]:
+        healthy = [e for e in self.endpoints if not e.ejected]
+        # Never eject more than the allowed share; past that, use everything.
+        if len(healthy) < len(self.endpoints) * (1 - settings.OUTLIER_MAX_EJECTED_RATIO):
+            return self.endpoints
+        return healthy
+
+    def pick(self) -> Endpoint:
+        candidates = self.healthy()
+        if len(candidates) == 1:
+            return candidates[0]
+        if self.strategy == ROUND_ROBIN:
+            return candidates[next(self._rr) % len(candidates)]
+        if self.strategy == LEAST_OUTSTANDING:
+            fewest = min(e.outstanding for e in candidates)
+            return random.choice([e for e in candidates if e.outstanding == fewest])
+        first, second = random.sample(candidates, 2)
+        return first if first.outstanding <= second.outstanding else second
+
+    def pick_sticky(self, key) -> Endpoint:
+        """Rendezvous hashing: the same key maps to the same healthy endpoint."""
+        def weight(endpoint: Endpoint) -> bytes:
+            return hashlib.blake2b(f"{key}|{endpoint.url}".encode(), digest_size=8).digest()
+        return max(self.healthy(), key=weight)
+
+
+class ServiceRegistry:
+
+    def __init__(self):
+        self._services: dict[tuple, list[tuple[str, Service]]] = {}
+        self._by_name: dict[str, Service] = {}
+        for name, base_url in service_urls().items():
+            strategy = settings.LB_STRATEGIES.get(name, settings.LB_STRATEGY)
+            service = Service(name, base_url, strategy)
+            prefixes = self._services.setdefault(_origin(service.base_url), [])
+            path = _base_path(service.base_url)
+            for other_path, other in prefixes:
+                if other_path == path:
+                    raise ValueError(
+                        f"{other.name} and {name} services share the base URL {base_url}; "
+                        "give each one its own host, port or path prefix"
+                    )
+            prefixes.append((path, service))
+            # Longest prefix first
+            prefixes.sort(key=lambda item: len(item[0]), reverse=True)
+            self._by_name[name] = service
+        self._file_mtime: float | None = None
+        self._file_endpoints: dict[str, list[str]] = {}
+        self._srv_endpoints: dict[str, list[str]] = {}
+        self._apply()
+
+    def service_for(self, url: httpx.URL) -> Service | None:
+        path = url.path
+        for prefix, service in self._services.get(_origin(url), ()):
+            if not prefix or path == prefix or path.startswith(prefix + "/"):
+                return service
+        return None
+
+    def pick_sticky(self, base_url: str, key) -> Endpoint:
+        return self.service_for(httpx.URL(base_url)).pick_sticky(key)
+
+    def _apply(self):
+        for name, service in self._by_name.items():
+            urls = [
+                *settings.SERVICE_ENDPOINTS.get(name, []),
+                *self._file_endpoints.get(name, []),
+                *self._srv_endpoints.get(name, []),
+            ]
+            service.set_endpoints(urls)
+
+    def _load_file(self) -> bool:
+        path = settings.SERVICE_ENDPOINTS_FILE
+        if not path:
+            return False
+        try:
+            mtime = os.stat(path).st_mtime
+            if mtime == self._file_mtime:
+                return False
+            with open(path, encoding="utf-8") as f:
+                self._file_endpoints = json.load(f)
+            self._file_mtime = mtime
+            return True
+        except (OSError, ValueError) as e:
+            logger.warning("Could not load service endpoints from %s: %s", path, e)
+            return False
+
+    async def _resolve_srv(self) -> bool:
+        if not settings.SERVICE_SRV_RECORDS:
+            return False
+        if dns is None:
+            logger.warning("SERVICE_SRV_RECORDS is set but dnspython is not installed")
+            return False
+        resolved = {}
+        for name, record in settings.SERVICE_SRV_RECORDS.items():
+            scheme = self._by_name[name].base_url.scheme
+            try:
+                answer = await dns.asyncresolver.resolve(record, "SRV")
+            except Exception as e:
+                # Keep the last known endpoints when DNS is unavailable.
+                logger.warning("SRV lookup of %s failed: %s", record, e)
+                resolved[name] = self._srv_endpoints.get(name, [])
+                continue
+            resolved[name] = [
+                f"{scheme}://{str(rr.target).rstrip('.')}:{rr.port}"
+                for rr in sorted(answer, key=lambda rr: (rr.priority, -rr.weight))
+            ]
+        changed = resolved != self._srv_endpoints
+        self._srv_endpoints = resolved
+        return changed
+
+    async def refresh(self):
+        file_changed = await asyncio.to_thread(self._load_file)
+        srv_changed = await self._resolve_srv()
+        if file_changed or srv_changed:
+            self._apply()
+
+    async def run_refresher(self):
+        while True:
+            try:
+                await self.refresh()
+            except Exception:
+                logger.exception("Service discovery refresh failed")
+            await asyncio.sleep(settings.DISCOVERY_REFRESH_INTERVAL)
+
+
+class _TrackedStream(httpx.AsyncByteStream):
+    """Releases the endpoint's outstanding slot once the body is consumed."""
+
+    def __init__(self, stream, endpoint: Endpoint):
+        self._stream = stream
+        self._endpoint = endpoint
+        self._released = False
+
+    async def __aiter__(self):
+        async for chunk in self._stream:
+            yield chunk
+
+    async def aclose(self):
+        try:
+            await self._stream.aclose()
+        finally:
+            if not self._released:
+                self._released = True
+                self._endpoint.outstanding -= 1
+
+
+class BalancingTransport(httpx.AsyncBaseTransport):
+
+    def __init__(self, transport: httpx.AsyncBaseTransport):
+        self._transport = transport
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        service = registry.service_for(request.url)
+        if service is None:
+            return await self._transport.handle_async_request(request)
+
+        endpoint = service.pick()
+        request.url = request.url.copy_with(
+            scheme=endpoint.url.scheme, host=endpoint.url.host, port=endpoint.url.port
+        )
+        request.headers["Host"] = request.url.netloc.decode("ascii")
+
+        endpoint.outstanding += 1
+        try:
+            response = await self._transport.handle_async_request(request)
+        except BaseException as e:
+            endpoint.outstanding -= 1
+            if isinstance(e, httpx.TransportError):
+                endpoint.failed()
+            raise
+
+        if response.status_code in FAILURE_STATUSES:
+            endpoint.failed()
+        else:
+            endpoint.succeeded()
+        if response.is_closed:
+            endpoint.outstanding -= 1
+        else:
+            response.stream = _TrackedStream(response.stream, endpoint)
+        return response
+
+    async def aclose(self):
+        await self._transport.aclose()
+
+
+registry = LazyObject(ServiceRegistry)
@@ -0,0 +1,80 @@
+"""ETag generation and If-None-Match handling for proxied GET responses."""
+import hashlib
+
+
+class ETagMiddleware:
+    """Tag 200 GET responses and answer 304 when the client copy is current.
+
+    The tag is a hash of the body, so no upstream cooperation is needed: an
+    unchanged chat list or message page is not re-sent to the client. Tags
+    are weak because the compression layer may change the byte encoding.
+    """
+
+    def __init__(self, app, path_prefixes: tuple[str, ...]):
+        self.app = app
+        self.path_prefixes = path_prefixes
+
+    async def __call__(self, scope, receive, send):
+        if (
+            scope["type"] != "http"
+            or scope["method"] not in ("GET", "HEAD")
+            or not scope["path"].startswith(self.path_prefixes)
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        if_none_match = None
+        for name, value in scope.get("headers", []):
+            if name == b"if-none-match":
+                if_none_match = value.decode("latin-1")
+
+        start_message = None
+        passthrough = False
+
+        async def wrapped_send(message):
+            nonlocal start_message, passthrough
+
+            if message["type"] == "http.response.start":
+                start_message = message
+                return
+            if message["type"] != "http.response.body" or passthrough:
+                await send(message)
+                return
+
+            headers = start_message.get("headers", [])
+            already_tagged = any(k.lower() == b"etag" for k, _ in headers)
+            if start_message["status"] != 200 or message.get("more_body", False) or already_tagged:
+                # Streamed or non-cacheable responses are passed through untouched.
+                passthrough = True
+                await send(start_message)
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            etag = f'W/"{hashlib.blake2b(body, digest_size=16).hexdigest()}"'
+            extra = [(b"etag", etag.encode())]
+            if not any(k.lower() == b"cache-control" for k, _ in headers):
+                # Responses are per user: let the browser keep them but revalidate.
+                extra.append((b"cache-control", b"private, no-cache"))
+
+            if if_none_match and _matches(if_none_match, etag):
+                kept = [
+                    (k, v) for k, v in headers
+                    if k.lower() not in (b"content-length", b"content-type")
+                ]
+                await send({"type": "http.response.start", "status": 304, "headers": kept + extra})
+                await send({"type": "http.response.body", "body": b""})
+                return
+
+            await send({**start_message, "headers": list(headers) + extra})
+            await send(message)
+
+        await self.app(scope, receive, wrapped_send)
+
+
+def _matches(if_none_match: str, etag: str) -> bool:
+    if if_none_match.strip() == "*":
+        return True
+    # Weak comparison (RFC 9110 13.1.2): ignore the W/ prefix on both sides.
+    opaque = etag.removeprefix("W/")
+    return any(tag.strip().removeprefix("W/") == opaque for tag in if_none_match.split(","))
@@ -0,0 +1,52 @@
+"""In-process pub/sub bus for gateway-originated events pushed over WebSockets.
+
+Routes publish events addressed to a user id (match created, dismatch, unread
+changes) and every WebSocket of that user connected to this gateway process
+receives them. Subscribers get a bounded queue; when a slow client falls
+behind, the oldest pending events are dropped instead of growing memory.
+"""
+import asyncio
+import time
+
+EVENT_MATCH_CREATED = "match_created"
+EVENT_DISMATCH = "dismatch"
+EVENT_UNREAD_CHANGED = "unread_changed"
+
+
+class EventBus:
+
+    def __init__(self, queue_size: int = 100):
+        self.queue_size = queue_size
+        self._subscribers: dict[int, set[asyncio.Queue]] = {}
+
+    def subscribe(self, user_id: int) -> asyncio.Queue:
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        self._subscribers.setdefault(int(user_id), set()).add(queue)
+        return queue
+
+    def unsubscribe(self, user_id: int, queue: asyncio.Queue):
+        queues = self._subscribers.get(int(user_id))
+        if not queues:
+            return
+        queues.discard(queue)
+        if not queues:
+            self._subscribers.pop(int(user_id), None)
+
+    def publish(self, user_id: int | None, event: str, **data):
+        if user_id is None:
+            return
+        queues = self._subscribers.get(int(user_id))
+        if not queues:
+            return
+
+        message = {"type": "gateway_event", "event": event, "ts": int(time.time()), **data}
+        for queue in queues:
+            if queue.full():
+                try:
+                    queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    pass
+            queue.put_nowait(message)
+
+
+event_bus = EventBus()
@@ -0,0 +1,145 @@
+"""Per-user set of excluded user ids, kept incrementally at the gateway.
+
+The excluded list of a user only grows as they swipe, so instead of
+downloading it from the matching service on every /matching/potential
+call the gateway keeps it as a sorted `array` of ids per user. Each
+swipe accepted by the gateway adds the swiped id locally; the list is
+re-fetched (reconciled) from the matching service once it is older than
+EXCLUSION_RECONCILE_INTERVAL, after flushing the user's buffered swipes,
+merging ids added while that fetch was in flight. A swipe whose target id
+cannot be read marks the set stale, so the next call reconciles. The fetch
+runs in a fresh context: it is shared by every caller waiting on it, so it
+must not inherit the deadline of the request that started it.
+
+`encode_delta_varint` packs a sorted id list as base64 of LEB128-encoded
+gaps, a few bytes per id instead of a JSON list of ints.
+"""
+import asyncio
+import base64
+import contextvars
+import time
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict
+
+from .config import settings, LazyObject
+from .json_stream import iter_json_items
+from .swipe_buffer import swipe_buffer
+from .upstream import get_client
+
+DELTA_VARINT_ENCODING = "delta-varint-base64"
+
+
+class ExclusionLookupError(Exception):
+    """The matching service answered with a non-200 status."""
+
+    def __init__(self, status_code: int):
+        self.status_code = status_code
+
+
+def encode_delta_varint(ids: array) -> str:
+    """Base64 of the LEB128 varints of the gaps between sorted, unique ids."""
+    out = bytearray()
+    previous = 0
+    for value in ids:
+        gap = value - previous
+        previous = value
+        while gap >= 0x80:
+            out.append((gap & 0x7F) | 0x80)
+            gap >>= 7
+        out.append(gap)
+    return base64.b64encode(bytes(out)).decode("ascii")
+
+
+class _Entry:
+    __slots__ = ("ids", "fetched_at", "added_during_fetch", "stale")
+
+    def __init__(self):
+        self.ids = array("q")
+        self.fetched_at = 0.0
+        self.added_during_fetch: set[int] | None = None
+        self.stale = False
+
+    def add(self, user_id: int):
+        i = bisect_left(self.ids, user_id)
+        if i == len(self.ids) or self.ids[i] != user_id:
+            self.ids.insert(i, user_id)
+        if self.added_during_fetch is not None:
+            self.added_during_fetch.add(user_id)
+
+
+class ExclusionCache:
+
+    def __init__(self, reconcile_interval: float, max_users: int):
+        self.reconcile_interval = reconcile_interval
+        self.max_users = max_users
+        self._entries: OrderedDict[int, _Entry] = OrderedDict()
+        self._inflight: dict[int, asyncio.Future] = {}
+
+    def add(self, user_id: int, excluded_id: int | None):
+        """Record a swipe; only users whose set is already loaded are updated."""
+        if excluded_id is None:
+            self.invalidate(user_id)
+            return
+        entry = self._entries.get(int(user_id))
+        if entry is not None:
+            entry.add(int(excluded_id))
+
+    def invalidate(self, user_id: int):
+        """Force the next get() to reconcile, even if a fetch is in flight now."""
+        entry = self._entries.get(int(user_id))
+        if entry is not None:
+            entry.fetched_at = 0.0
+            entry.stale = True
+
+    async def get(self, user_id: int) -> array:
+        user_id = int(user_id)
+        entry = self._entries.get(user_id)
+        if entry is not None and time.monotonic() - entry.fetched_at < self.reconcile_interval:
+            self._entries.move_to_end(user_id)
+            return entry.ids
+
+        inflight = self._inflight.get(user_id)
+        if inflight is None:
+            inflight = asyncio.get_running_loop().create_task(
+                self._reconcile(user_id), context=contextvars.Context()
+            )
+            self._inflight[user_id] = inflight
+            inflight.add_done_callback(lambda _: self._inflight.pop(user_id, None))
+        return await asyncio.shield(inflight)
+
+    async def _reconcile(self, user_id: int) -> array:
+        entry = self._entries.get(user_id)
+        if entry is None:
+            # Registered before the fetch so swipes made meanwhile are kept.
+            entry = self._entries[user_id] = _Entry()
+        entry.added_during_fetch = set()
+        entry.stale = False
+        started = time.monotonic()
+        try:
+            # Buffered swipes must reach the matching service before its
+            # list replaces ours.
+            await swipe_buffer.flush_user(user_id)
+            async with get_client().stream(
+                "GET", f"{settings.MATCHING_SERVICE_URL}/matching/excluded-users/{user_id}"
+            ) as res:
+                if res.status_code != 200:
+                    raise ExclusionLookupError(res.status_code)
+                fetched = {i async for i in iter_json_items(res.aiter_bytes(), key="excluded_ids")}
+            fetched |= entry.added_during_fetch
+            entry.ids = array("q", sorted(fetched))
+            entry.fetched_at = 0.0 if entry.stale else started
+        finally:
+            entry.added_during_fetch = None
+
+        self._entries[user_id] = entry
+        self._entries.move_to_end(user_id)
+        while len(self._entries) > self.max_users:
+            self._entries.popitem(last=False)
+        return entry.ids
+
+
+exclusion_cache = LazyObject(lambda: ExclusionCache(
+    reconcile_interval=settings.EXCLUSION_RECONCILE_INTERVAL,
+    max_users=settings.EXCLUSION_CACHE_MAX_USERS,
+))
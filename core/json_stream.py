@@ -0,0 +1,164 @@
+"""Bounded upstream bodies and incremental parsing of large JSON lists.
+
+`enforce_response_limit` (a response hook of the shared client) caps the
+size of every upstream body by path prefix (RESPONSE_LIMITS /
+settings.UPSTREAM_RESPONSE_LIMITS). An oversized body is rejected from its
+Content-Length before anything is read, or aborted as soon as the streamed
+byte count passes the limit. ResponseTooLarge is an httpx.RequestError,
+so handlers answer it like an unavailable upstream (503).
+
+`iter_json_items` yields the elements of a JSON array as the body streams
+in (the whole document, or the array under one top-level key), so handlers
+can keep only what they need instead of materialising the full list.
+"""
+import codecs
+import json
+from typing import AsyncIterator
+
+import httpx
+
+from .config import settings
+
+# Longest matching upstream path prefix wins; others get UPSTREAM_MAX_RESPONSE_BYTES.
+RESPONSE_LIMITS = {
+    "/user/profiles": 50 * 1024 * 1024,
+    "/user/profiles/random": 1024 * 1024,
+    "/matching/excluded-users/": 10 * 1024 * 1024,
+}
+
+
+class ResponseTooLarge(httpx.RequestError):
+    pass
+
+
+def response_limit(path: str) -> int:
+    limits = {**RESPONSE_LIMITS, **settings.UPSTREAM_RESPONSE_LIMITS}
+    matches = [prefix for prefix in limits if path.startswith(prefix)]
+    if not matches:
+        return settings.UPSTREAM_MAX_RESPONSE_BYTES
+    return limits[max(matches, key=len)]
+
+
+class _LimitedStream(httpx.AsyncByteStream):
+
+    def __init__(self, stream, limit: int, request: httpx.Request):
+        self._stream = stream
+        self._limit = limit
+        self._request = request
+
+    async def __aiter__(self):
+        received = 0
+        async for chunk in self._stream:
+            received += len(chunk)
+            if received > self._limit:
+                raise ResponseTooLarge(
+                    f"Upstream response exceeded {self._limit} bytes", request=self._request
+                )
+            yield chunk
+
+    async def aclose(self):
+        await self._stream.aclose()
+
+
+async def enforce_response_limit(response: httpx.Response):
+    """httpx response hook: abort bodies larger than the path's limit."""
+    request = response.request
+    limit = response_limit(request.url.path)
+    length = response.headers.get("content-length", "")
+    if length.isdigit() and int(length) > limit:
+        await response.aclose()
+        raise ResponseTooLarge(
+            f"Upstream response of {length} bytes exceeds {limit} bytes", request=request
+        )
+    if not response.is_closed:
+        response.stream = _LimitedStream(response.stream, limit, request)
+
+
+class _Reader:
+    """Decodes JSON values one at a time from a stream of byte chunks."""
+
+    def __init__(self, chunks: AsyncIterator[bytes]):
+        self._chunks = chunks.__aiter__()
+        self._text = codecs.getincrementaldecoder("utf-8")()
+        self._decoder = json.JSONDecoder()
+        self.buf = ""
+        self.pos = 0
+        self.done = False
+
+    async def _fill(self) -> bool:
+        if self.done:
+            return False
+        try:
+            chunk = await self._chunks.__anext__()
+        except StopAsyncIteration:
+            self.done = True
+            self.buf = self.buf[self.pos:] + self._text.decode(b"", final=True)
+        else:
+            # Drop what was already consumed so only the current item is held.
+            self.buf = self.buf[self.pos:] + self._text.decode(chunk)
+        self.pos = 0
+        return True
+
+    async def peek(self) -> str:
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in " \t\r\n":
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not await self._fill():
+                raise ValueError("Unexpected end of JSON document")
+
+    async def expect(self, char: str):
+        if await self.peek() != char:
+            raise ValueError(f"Expected {char!r} at JSON position {self.pos}")
+        self.pos += 1
+
+    async def value(self):
+        await self.peek()
+        while True:
+            try:
+                obj, end = self._decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                if not await self._fill():
+                    raise
+                continue
+            # A number cut by a chunk boundary ("12|3", "1|.5", "1.5|e3")
+            # decodes as a shorter number: wait for the rest of it.
+            if not self.done and (
+                end == len(self.buf)
+                or (type(obj) in (int, float) and self.buf[end] in ".eE")
+            ):
+                await self._fill()
+                continue
+            self.pos = end
+            return obj
+
+
+async def iter_json_items(chunks: AsyncIterator[bytes], key: str | None = None) -> AsyncIterator:
+    """Yield the items of the JSON array in `chunks` (or under top-level `key`)."""
+    reader = _Reader(chunks)
+
+    if key is not None:
+        await reader.expect("{")
+        while True:
+            if await reader.peek() == "}":
+                return
+            name = await reader.value()
+            await reader.expect(":")
+            if name == key:
+                break
+            await reader.value()  # some other field: parse and drop it
+            if await reader.peek() == ",":
+                reader.pos += 1
+
+    await reader.expect("[")
+    if await reader.peek() == "]":
+        return
+    while True:
+        yield await reader.value()
+        char = await reader.peek()
+        reader.pos += 1
+        if char == "]":
+            return
+        if char != ",":
+            raise ValueError(f"Expected ',' or ']' in JSON array, got {char!r}")
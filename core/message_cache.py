@@ -0,0 +1,150 @@
+"""Per-chat cache of the most recent message page.
+
+Populated from page 1 responses of `/chat/chats/{chat_id}/messages`, kept
+up to date with the messages relayed through the chat WebSocket, dropped
+when a client sends a message through the gateway and patched when a user
+marks the chat as read. Only users that already fetched the chat
+from the chat service (and were therefore authorised by it) are served from
+the cache.
+"""
+import json
+import time
+from collections import OrderedDict
+
+from .config import settings, LazyObject
+from .models import Message, ValidationMode, validation_mode
+
+MESSAGE_FIELDS = ("id", "chat_id", "sender_id", "content", "created_at")
+
+
+class _ChatEntry:
+    __slots__ = ("messages", "total", "newest_first", "participants", "expires_at")
+
+    def __init__(self, messages: list[Message], total: int, newest_first: bool | None):
+        self.messages = messages
+        self.total = total
+        # None when the page had fewer than two messages and the order is unknown
+        self.newest_first = newest_first
+        self.participants: set[int] = set()
+        self.expires_at = time.monotonic() + settings.MESSAGE_CACHE_TTL
+
+    @property
+    def complete(self) -> bool:
+        return len(self.messages) >= self.total
+
+
+class MessageCache:
+
+    def __init__(self, max_chats: int, max_messages_per_chat: int):
+        self.max_chats = max_chats
+        self.max_messages_per_chat = max_messages_per_chat
+        self._chats: OrderedDict[int, _ChatEntry] = OrderedDict()
+
+    def _get_entry(self, chat_id: int) -> _ChatEntry | None:
+        entry = self._chats.get(chat_id)
+        if entry is None:
+            return None
+        if entry.expires_at < time.monotonic():
+            self._chats.pop(chat_id, None)
+            return None
+        self._chats.move_to_end(chat_id)
+        return entry
+
+    def store_page(self, chat_id: int, user_id: int, page: dict):
+        """Remember a page 1 response fetched from the chat service."""
+        mode = validation_mode("chat.messages")
+        messages = [Message.from_upstream(m, mode) for m in page.get("messages", [])]
+        newest_first = None
+        if len(messages) >= 2:
+            newest_first = messages[0].id > messages[-1].id
+
+        entry = self._get_entry(chat_id)
+        participants = entry.participants if entry else set()
+        # The page just fetched is the newest state, even if it is shorter.
+        entry = _ChatEntry(messages[:self.max_messages_per_chat], page.get("total", len(messages)), newest_first)
+        entry.participants = participants | {int(user_id)}
+        self._chats[chat_id] = entry
+        self._chats.move_to_end(chat_id)
+
+        while len(self._chats) > self.max_chats:
+            self._chats.popitem(last=False)
+
+    def get_page(self, chat_id: int, user_id: int, page_size: int) -> dict | None:
+        entry = self._get_entry(chat_id)
+        if entry is None or int(user_id) not in entry.participants:
+            return None
+
+        if entry.newest_first:
+            if len(entry.messages) < page_size and not entry.complete:
+                return None
+            messages = entry.messages[:page_size]
+        else:
+            # Oldest-first pages are only safe to rebuild when the whole chat fits.
+            if not entry.complete or entry.total > page_size:
+                return None
+            messages = list(entry.messages)
+        return {
+            "messages": [m.to_dict() for m in messages],
+            "total": entry.total,
+            "page": 1,
+            "page_size": page_size,
+            "has_more": entry.total > page_size,
+        }
+
+    def add_message(self, message: Message):
+        """Apply a new message seen on the WebSocket relay."""
+        entry = self._get_entry(message.chat_id)
+        if entry is None:
+            return
+
+        for i, cached in enumerate(entry.messages):
+            if cached.id == message.id:
+                entry.messages[i] = message
+                return
+
+        if entry.newest_first:
+            entry.messages.insert(0, message)
+            del entry.messages[self.max_messages_per_chat:]
+        elif entry.newest_first is False and entry.complete:
+            entry.messages.append(message)
+        else:
+            # Cannot tell where the message belongs on page 1: refetch next time.
+            self.invalidate(message.chat_id)
+            return
+        entry.total += 1
+
+    def mark_read(self, chat_id: int, reader_id: int):
+        entry = self._get_entry(chat_id)
+        if entry is None:
+            return
+        for message in entry.messages:
+            if message.sender_id != reader_id:
+                message.is_read = True
+
+    def invalidate(self, chat_id: int):
+        self._chats.pop(chat_id, None)
+
+    def observe_relayed(self, raw: str):
+        """Update the cache from a raw frame sent by the chat service WebSocket."""
+        try:
+            data = json.loads(raw)
+        except (TypeError, ValueError):
+            return
+        if not isinstance(data, dict):
+            return
+
+        candidate = data.get("message") if isinstance(data.get("message"), dict) else data
+        if all(field in candidate for field in MESSAGE_FIELDS):
+            try:
+                self.add_message(Message.from_upstream(candidate, ValidationMode.TRUSTED))
+            except (KeyError, TypeError):
+                self.invalidate(candidate.get("chat_id"))
+        elif isinstance(data.get("chat_id"), int):
+            # Some other chat event (e.g. read receipt): drop what we have.
+            self.invalidate(data["chat_id"])
+
+
+message_cache = LazyObject(lambda: MessageCache(
+    max_chats=settings.MESSAGE_CACHE_MAX_CHATS,
+    max_messages_per_chat=settings.MESSAGE_CACHE_MAX_PER_CHAT,
+))
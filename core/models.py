@@ -0,0 +1,139 @@
+"""Compact internal representations of upstream payloads.
+
+The gateway keeps profiles, messages and relationships in its caches and
+aggregations. Holding them as slotted dataclasses instead of the raw JSON
+dicts (or full Pydantic models) cuts per-object memory and allocation cost.
+
+How much validation an upstream payload gets is chosen per route:
+  - STRICT: payloads are checked against the schemas in schemas.py and the
+    handler's response_model validates the answer again.
+  - TRUSTED: the upstream is one of our own services; fields are read as-is
+    and the response is serialised without the response_model pass.
+"""
+from dataclasses import dataclass, asdict
+from enum import Enum
+
+import httpx
+from fastapi import Response
+from fastapi.responses import JSONResponse
+
+from schemas import MessageResponse, ActiveRelationshipResponse
+from .config import settings
+
+
+class ValidationMode(str, Enum):
+    STRICT = "strict"
+    TRUSTED = "trusted"
+
+
+# Hot read paths answered straight from our own chat service. Any route can
+# be switched with settings.VALIDATION_MODES, e.g. {"chat.messages": "strict"}.
+ROUTE_VALIDATION_MODES = {
+    "chat.chats": ValidationMode.TRUSTED,
+    "chat.inbox": ValidationMode.TRUSTED,
+    "chat.messages": ValidationMode.TRUSTED,
+}
+
+
+def validation_mode(route: str) -> ValidationMode:
+    configured = settings.VALIDATION_MODES.get(route)
+    if configured is not None:
+        return ValidationMode(configured)
+    return ROUTE_VALIDATION_MODES.get(route, ValidationMode.STRICT)
+
+
+def respond(route: str, data):
+    """Return `data` from a handler honouring the route's validation mode."""
+    if validation_mode(route) is ValidationMode.TRUSTED:
+        return JSONResponse(data)
+    return data
+
+
+def respond_upstream(route: str, res: httpx.Response):
+    """Like `respond`, for an upstream JSON answer forwarded unchanged.
+
+    In TRUSTED mode the upstream bytes are passed through without being
+    parsed and re-serialised by the gateway.
+    """
+    if validation_mode(route) is ValidationMode.TRUSTED:
+        return Response(content=res.content, media_type="application/json")
+    return res.json()
+
+
+@dataclass(slots=True)
+class Profile:
+    """The part of a user profile the gateway needs for enrichment."""
+    id: int
+    username: str | None
+    photo_url: str | None
+
+    @classmethod
+    def from_upstream(cls, data: dict) -> "Profile":
+        images = data.get("images") or []
+        return cls(id=data["id"], username=data.get("username"), photo_url=images[0] if images else None)
+
+
+@dataclass(slots=True)
+class Message:
+    id: int
+    chat_id: int
+    sender_id: int
+    content: str
+    # Kept as the upstream string: it is only ever sent back out as JSON.
+    created_at: str
+    is_read: bool = False
+
+    @classmethod
+    def from_upstream(cls, data: dict, mode: ValidationMode = ValidationMode.TRUSTED) -> "Message":
+        if mode is ValidationMode.STRICT:
+            MessageResponse.model_validate(data)
+        return cls(
+            id=data["id"],
+            chat_id=data["chat_id"],
+            sender_id=data["sender_id"],
+            content=data["content"],
+            created_at=data["created_at"],
+            is_read=data.get("is_read", False),
+        )
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+
+@dataclass(slots=True)
+class Relationship:
+    has_active_match: bool
+    relationship_id: int | None = None
+    user1_id: int | None = None
+    user2_id: int | None = None
+    partner_id: int | None = None
+    state: str | None = None
+    creation_date: int | None = None
+
+    @classmethod
+    def from_upstream(cls, data: dict, mode: ValidationMode = ValidationMode.TRUSTED) -> "Relationship":
+        if mode is ValidationMode.STRICT:
+            ActiveRelationshipResponse.model_validate(data)
+        return cls(
+            has_active_match=bool(data.get("has_active_match", data.get("exists", False))),
+            relationship_id=data.get("relationship_id"),
+            user1_id=data.get("user1_id"),
+            user2_id=data.get("user2_id"),
+            partner_id=data.get("partner_id"),
+            state=data.get("state"),
+            creation_date=data.get("creation_date"),
+        )
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+    def to_check_dict(self) -> dict:
+        """Shape of /matching/relationships/check (RelationshipCheckResponse)."""
+        return {
+            "exists": self.has_active_match,
+            "relationship_id": self.relationship_id,
+            "user1_id": self.user1_id,
+            "user2_id": self.user2_id,
+            "state": self.state,
+            "creation_date": self.creation_date,
+        }
@@ -0,0 +1,150 @@
+"""Durable outbox for follow-up upstream calls that must eventually happen.
+
+Jobs are persisted in a local SQLite database before they are attempted, so
+a failed or interrupted call (e.g. the auth service being down right after a
+profile was created) is retried in the background, with exponential backoff,
+even across gateway restarts. A handler raises PermanentFailure for errors
+that retrying cannot fix (e.g. a 4xx answer); the job is then dead-lettered
+right away.
+"""
+import asyncio
+import json
+import logging
+import sqlite3
+import time
+from typing import Awaitable, Callable
+
+from .config import settings, LazyObject
+
+logger = logging.getLogger("uvicorn.error")
+
+Handler = Callable[[dict], Awaitable[dict | None]]
+
+_handlers: dict[str, Handler] = {}
+
+
+class PermanentFailure(Exception):
+    """The job can never succeed; it is dead-lettered without further retries."""
+
+
+def register(kind: str):
+    """Decorator registering the coroutine that performs jobs of `kind`."""
+    def decorator(fn: Handler) -> Handler:
+        _handlers[kind] = fn
+        return fn
+    return decorator
+
+
+class Outbox:
+
+    def __init__(self, path: str):
+        self.path = path
+        self._wakeup = asyncio.Event()
+        self._init_db()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=5.0)
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    def _init_db(self):
+        with self._connect() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS outbox (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    kind TEXT NOT NULL,
+                    payload TEXT NOT NULL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    next_attempt_at REAL NOT NULL,
+                    last_error TEXT,
+                    dead INTEGER NOT NULL DEFAULT 0,
+                    created_at REAL NOT NULL
+                )
+            """)
+
+    def _insert(self, kind: str, payload: dict, delay: float) -> int:
+        now = time.time()
+        with self._connect() as conn:
+            cur = conn.execute(
+                "INSERT INTO outbox (kind, payload, next_attempt_at, created_at) VALUES (?, ?, ?, ?)",
+                (kind, json.dumps(payload), now + delay, now),
+            )
+            return cur.lastrowid
+
+    def _due(self, limit: int) -> list[tuple[int, str, str, int]]:
+        with self._connect() as conn:
+            return conn.execute(
+                "SELECT id, kind, payload, attempts FROM outbox"
+                " WHERE dead = 0 AND next_attempt_at <= ? ORDER BY next_attempt_at LIMIT ?",
+                (time.time(), limit),
+            ).fetchall()
+
+    def _delete(self, job_id: int):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM outbox WHERE id = ?", (job_id,))
+
+    def _reschedule(self, job_id: int, attempts: int, error: str, permanent: bool = False):
+        delay = min(settings.OUTBOX_MAX_BACKOFF, settings.OUTBOX_BASE_BACKOFF * (2 ** attempts))
+        dead = 1 if permanent or attempts >= settings.OUTBOX_MAX_ATTEMPTS else 0
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE outbox SET attempts = ?, next_attempt_at = ?, last_error = ?, dead = ? WHERE id = ?",
+                (attempts, time.time() + delay, error[:500], dead, job_id),
+            )
+        if dead:
+            logger.error("Outbox job %s gave up after %s attempts: %s", job_id, attempts, error)
+
+    async def enqueue(self, kind: str, payload: dict, delay: float = 0.0) -> int:
+        """Persist a job. `delay` keeps the worker away from it while the
+        caller attempts it inline with `run_now`."""
+        if kind not in _handlers:
+            raise ValueError(f"No outbox handler registered for {kind!r}")
+        job_id = await asyncio.to_thread(self._insert, kind, payload, delay)
+        if delay <= 0:
+            self._wakeup.set()
+        return job_id
+
+    async def _execute(self, job_id: int, kind: str, payload: dict, attempts: int) -> dict | None:
+        try:
+            result = await _handlers[kind](payload)
+        except asyncio.CancelledError:
+            # Cancelled mid-flight: count the attempt so the worker retries it.
+            await asyncio.shield(asyncio.to_thread(self._reschedule, job_id, attempts + 1, "cancelled"))
+            raise
+        except PermanentFailure as e:
+            await asyncio.to_thread(self._reschedule, job_id, attempts + 1, repr(e), True)
+            raise
+        except Exception as e:
+            await asyncio.to_thread(self._reschedule, job_id, attempts + 1, repr(e))
+            raise
+        await asyncio.to_thread(self._delete, job_id)
+        return result
+
+    async def run_now(self, job_id: int, kind: str, payload: dict) -> dict | None:
+        """Attempt a just-enqueued job inline; on failure the worker takes over."""
+        return await self._execute(job_id, kind, payload, attempts=0)
+
+    async def process_due(self):
+        for job_id, kind, payload, attempts in await asyncio.to_thread(self._due, settings.OUTBOX_BATCH_SIZE):
+            try:
+                await self._execute(job_id, kind, json.loads(payload), attempts)
+            except Exception as e:
+                logger.warning("Outbox job %s (%s) failed: %r", job_id, kind, e)
+
+    async def run_worker(self):
+        while True:
+            try:
+                await self.process_due()
+            except Exception:
+                logger.exception("Outbox worker iteration failed")
+            self._wakeup.clear()
+            # asyncio.wait (unlike wait_for) never swallows a cancellation
+            # that races with the event being set.
+            waiter = asyncio.ensure_future(self._wakeup.wait())
+            try:
+                await asyncio.wait({waiter}, timeout=settings.OUTBOX_POLL_INTERVAL)
+            finally:
+                waiter.cancel()
+
+
+outbox = LazyObject(lambda: Outbox(settings.OUTBOX_DB_PATH))
@@ -0,0 +1,101 @@
+"""In-memory cache of user profiles used to enrich aggregated responses."""
+import asyncio
+import time
+from collections import OrderedDict
+
+from .config import settings, LazyObject
+from .models import Profile
+from .resilience import idempotent_get
+
+
+class ProfileCache:
+    """TTL + LRU cache of upstream profiles keyed by user id.
+
+    Concurrent lookups for the same id share a single upstream request, and
+    the number of simultaneous upstream lookups is bounded so a large inbox
+    cannot flood the user service.
+    """
+
+    def __init__(self, ttl: float, max_entries: int, max_concurrency: int):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: OrderedDict[int, tuple[float, Profile | None]] = OrderedDict()
+        self._inflight: dict[int, asyncio.Future] = {}
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+
+    def get_cached(self, user_id: int) -> tuple[bool, Profile | None]:
+        entry = self._entries.get(user_id)
+        if entry is None:
+            return False, None
+        expires_at, profile = entry
+        if expires_at < time.monotonic():
+            self._entries.pop(user_id, None)
+            return False, None
+        self._entries.move_to_end(user_id)
+        return True, profile
+
+    def put(self, user_id: int, profile: Profile | None):
+        self._entries[user_id] = (time.monotonic() + self.ttl, profile)
+        self._entries.move_to_end(user_id)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, user_id: int):
+        self._entries.pop(user_id, None)
+
+    async def _fetch(self, user_id: int) -> Profile | None:
+        async with self._semaphore:
+            res = await idempotent_get(
+                f"{settings.USER_SERVICE_URL}/user/profile",
+                route="user.profile",
+                params={"user_id": user_id},
+            )
+        if res.status_code == 404:
+            # Deleted users are cached too, so they are not looked up again.
+            self.put(user_id, None)
+            return None
+        if res.status_code != 200:
+            return None
+        profile = Profile.from_upstream(res.json())
+        self.put(user_id, profile)
+        return profile
+
+    async def get(self, user_id: int) -> Profile | None:
+        hit, profile = self.get_cached(user_id)
+        if hit:
+            return profile
+
+        future = self._inflight.get(user_id)
+        if future is None:
+            future = asyncio.ensure_future(self._fetch(user_id))
+            self._inflight[user_id] = future
+            future.add_done_callback(lambda _: self._inflight.pop(user_id, None))
+        return await asyncio.shield(future)
+
+    async def get_many(self, user_ids: list[int], timeout: float) -> dict[int, Profile | None]:
+        """Resolve several profiles concurrently within `timeout` seconds.
+
+        Profiles that fail or do not arrive in time are reported as None so
+        the caller can still answer with partial data.
+        """
+        unique_ids = list(dict.fromkeys(user_ids))
+        tasks = {uid: asyncio.ensure_future(self.get(uid)) for uid in unique_ids}
+        if not tasks:
+            return {}
+
+        done, pending = await asyncio.wait(tasks.values(), timeout=timeout)
+        for task in pending:
+            task.cancel()
+
+        result = {}
+        for uid, task in tasks.items():
+            ok = task in done and not task.cancelled() and task.exception() is None
+            result[uid] = task.result() if ok else None
+        return result
+
+
+profile_cache = LazyObject(lambda: ProfileCache(
+    ttl=settings.PROFILE_CACHE_TTL,
+    max_entries=settings.PROFILE_CACHE_MAX_ENTRIES,
+    max_concurrency=settings.PROFILE_LOOKUP_CONCURRENCY,
+))
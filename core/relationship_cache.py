@@ -0,0 +1,123 @@
+"""Short-lived cache of relationship state, by user and by user pair.
+
+The active relationship of a user is read by the matching routes and by
+every chat WebSocket connect. Answers are cached as `Relationship` objects
+for RELATIONSHIP_CACHE_TTL seconds; "no active match" is cached too, for
+the shorter RELATIONSHIP_CACHE_NEGATIVE_TTL. The gateway's own swipe and
+dismatch handlers invalidate the users involved, so the TTL only bounds
+staleness from changes made elsewhere (e.g. through another gateway).
+"""
+import time
+from collections import OrderedDict
+
+import httpx
+
+from .config import settings, LazyObject
+from .models import Relationship, ValidationMode, validation_mode
+from .resilience import idempotent_get
+
+
+class RelationshipLookupError(Exception):
+    """The matching service answered with a non-200 status."""
+
+    def __init__(self, response: httpx.Response):
+        self.response = response
+
+
+def _pair(user1_id: int, user2_id: int) -> tuple[int, int]:
+    a, b = int(user1_id), int(user2_id)
+    return (a, b) if a <= b else (b, a)
+
+
+class RelationshipCache:
+
+    def __init__(self, ttl: float, negative_ttl: float, max_entries: int):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        self._by_user: OrderedDict[int, tuple[float, Relationship]] = OrderedDict()
+        self._by_pair: OrderedDict[tuple[int, int], tuple[float, Relationship]] = OrderedDict()
+
+    def _get(self, entries: OrderedDict, key) -> Relationship | None:
+        entry = entries.get(key)
+        if entry is None:
+            return None
+        expires_at, relationship = entry
+        if expires_at < time.monotonic():
+            entries.pop(key, None)
+            return None
+        entries.move_to_end(key)
+        return relationship
+
+    def _put(self, entries: OrderedDict, key, relationship: Relationship):
+        ttl = self.ttl if relationship.has_active_match else self.negative_ttl
+        entries[key] = (time.monotonic() + ttl, relationship)
+        entries.move_to_end(key)
+        while len(entries) > self.max_entries:
+            entries.popitem(last=False)
+
+    def put_active(self, user_id: int, relationship: Relationship):
+        self._put(self._by_user, int(user_id), relationship)
+        if relationship.has_active_match and relationship.user1_id and relationship.user2_id:
+            self._put(self._by_pair, _pair(relationship.user1_id, relationship.user2_id), relationship)
+
+    async def active(self, user_id: int) -> Relationship:
+        relationship = self._get(self._by_user, int(user_id))
+        if relationship is not None:
+            return relationship
+
+        res = await idempotent_get(
+            f"{settings.MATCHING_SERVICE_URL}/matching/relationships/user/{user_id}/active",
+            route="matching.active_relationship",
+        )
+        if res.status_code != 200:
+            raise RelationshipLookupError(res)
+        relationship = Relationship.from_upstream(
+            res.json(), validation_mode("matching.active_relationship")
+        )
+        self.put_active(user_id, relationship)
+        return relationship
+
+    async def between(self, user1_id: int, user2_id: int) -> Relationship:
+        key = _pair(user1_id, user2_id)
+        relationship = self._get(self._by_pair, key)
+        if relationship is not None:
+            return relationship
+
+        res = await idempotent_get(
+            f"{settings.MATCHING_SERVICE_URL}/matching/relationships/check",
+            route="matching.relationship_check",
+            params={"user1_id": user1_id, "user2_id": user2_id},
+        )
+        if res.status_code != 200:
+            raise RelationshipLookupError(res)
+        # The check payload uses "exists" instead of "has_active_match".
+        relationship = Relationship.from_upstream(res.json(), ValidationMode.TRUSTED)
+        self._put(self._by_pair, key, relationship)
+        return relationship
+
+    def invalidate(self, user_id: int, partner_id: int | None = None, relationship_id: int | None = None):
+        """Drop the state of a user, of the pair with `partner_id` and of the relationship.
+
+        Without `partner_id` every pair involving the user is dropped.
+        """
+        self._by_user.pop(int(user_id), None)
+        if partner_id is not None:
+            self._by_user.pop(int(partner_id), None)
+            self._by_pair.pop(_pair(user_id, partner_id), None)
+        else:
+            for key in [k for k in self._by_pair if int(user_id) in k]:
+                self._by_pair.pop(key, None)
+        if relationship_id is not None:
+            # Rare (dismatch), so a scan is fine here.
+            for entries in (self._by_user, self._by_pair):
+                stale = [k for k, (_, r) in entries.items() if r.relationship_id == relationship_id]
+                for key in stale:
+                    entries.pop(key, None)
+
+
+relationship_cache = LazyObject(lambda: RelationshipCache(
+    ttl=settings.RELATIONSHIP_CACHE_TTL,
+    negative_ttl=settings.RELATIONSHIP_CACHE_NEGATIVE_TTL,
+    max_entries=settings.RELATIONSHIP_CACHE_MAX_ENTRIES,
+))
@@ -0,0 +1,154 @@
+"""Retry and hedging policy for idempotent upstream reads.
+
+Only GET requests go through here: anything with side effects (swipes,
+dismatches, profile writes) keeps calling the client directly so it is never
+sent twice.
+"""
+import asyncio
+import random
+import time
+from collections import deque
+
+import httpx
+
+from . import deadline
+from .config import settings, LazyObject
+from .json_stream import ResponseTooLarge
+from .upstream import get_client
+
+RETRYABLE_STATUS = {502, 503, 504}
+
+
+class LatencyTracker:
+    """Recent latencies per route, used to derive the hedging delay."""
+
+    def __init__(self, window: int = 200):
+        self.window = window
+        self._samples: dict[str, deque] = {}
+
+    def record(self, route: str, seconds: float):
+        samples = self._samples.get(route)
+        if samples is None:
+            samples = self._samples[route] = deque(maxlen=self.window)
+        samples.append(seconds)
+
+    def percentile(self, route: str, pct: float) -> float | None:
+        samples = self._samples.get(route)
+        if not samples or len(samples) < settings.HEDGE_MIN_SAMPLES:
+            return None
+        ordered = sorted(samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * pct))]
+
+
+class RetryBudget:
+    """Token bucket that caps retries + hedges to a fraction of normal traffic.
+
+    Every first attempt deposits `ratio` tokens and every extra attempt costs
+    one, so when an upstream is down retries cannot multiply the load on it.
+    """
+
+    def __init__(self, ratio: float, max_tokens: float):
+        self.ratio = ratio
+        self.max_tokens = max_tokens
+        self.tokens = max_tokens
+
+    def deposit(self):
+        self.tokens = min(self.max_tokens, self.tokens + self.ratio)
+
+    def try_spend(self) -> bool:
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+
+latency_tracker = LatencyTracker()
+retry_budget = LazyObject(
+    lambda: RetryBudget(ratio=settings.RETRY_BUDGET_RATIO, max_tokens=settings.RETRY_BUDGET_MAX_TOKENS)
+)
+
+
+def _backoff(attempt: int) -> float:
+    # "Full jitter": uniform in [0, min(cap, base * 2^attempt)]
+    return random.uniform(0, min(settings.RETRY_MAX_DELAY, settings.RETRY_BASE_DELAY * (2 ** attempt)))
+
+
+async def _attempt(url: str, params, route: str, timeout: float) -> httpx.Response:
+    start = time.monotonic()
+    res = await get_client().get(url, params=params, timeout=timeout)
+    latency_tracker.record(route, time.monotonic() - start)
+    return res
+
+
+async def _hedged_attempt(url: str, params, route: str, timeout: float) -> httpx.Response:
+    """Send one attempt and, if it is slower than the route's p95, race a second one."""
+    primary = asyncio.ensure_future(_attempt(url, params, route, timeout))
+
+    delay = latency_tracker.percentile(route, 0.95) if settings.HEDGE_ENABLED else None
+    if delay is None or delay >= timeout:
+        return await primary
+
+    done, _ = await asyncio.wait({primary}, timeout=max(delay, settings.HEDGE_MIN_DELAY))
+    if done or not retry_budget.try_spend():
+        return await primary
+
+    hedge = asyncio.ensure_future(_attempt(url, params, route, timeout))
+    pending = {primary, hedge}
+    last_response = None
+    last_error = None
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is not None:
+                    last_error = task.exception()
+                    continue
+                last_response = task.result()
+                if last_response.status_code not in RETRYABLE_STATUS:
+                    return last_response
+    finally:
+        for task in pending:
+            task.cancel()
+
+    if last_response is not None:
+        return last_response
+    raise last_error
+
+
+async def idempotent_get(url: str, *, route: str, params=None) -> httpx.Response:
+    """GET `url` with jittered retries and hedging inside a deadline budget.
+
+    Retries connection errors and 502/503/504 answers. Raises the last
+    `httpx.RequestError` (or returns the last error response) when attempts,
+    deadline or retry budget are exhausted, so callers keep their existing
+    error handling. The budget is RETRY_DEADLINE, shortened to whatever is
+    left of the request's own deadline.
+    """
+    budget = settings.RETRY_DEADLINE
+    request_left = deadline.remaining()
+    if request_left is not None:
+        budget = min(budget, request_left)
+    deadline_at = time.monotonic() + budget
+    retry_budget.deposit()
+
+    attempt = 0
+    while True:
+        remaining = deadline_at - time.monotonic()
+        try:
+            res = await _hedged_attempt(url, params, route, remaining)
+            if res.status_code not in RETRYABLE_STATUS:
+                return res
+            error = None
+        except ResponseTooLarge:
+            raise  # would be just as large on a retry
+        except httpx.RequestError as e:
+            res, error = None, e
+
+        attempt += 1
+        pause = _backoff(attempt)
+        out_of_time = time.monotonic() + pause >= deadline_at
+        if attempt >= settings.RETRY_MAX_ATTEMPTS or out_of_time or not retry_budget.try_spend():
+            if error is not None:
+                raise error
+            return res
+        await asyncio.sleep(pause)
@@ -0,0 +1,99 @@
+"""Orchestration of writes that span several upstream services.
+
+A saga runs its critical steps in order; if one fails, the compensations of
+the steps already done run in reverse order and the error is re-raised.
+Once every critical step succeeded, the follow-up steps are persisted in the
+outbox: the first one may be attempted inline for a bounded time so its
+result can still be returned to the client, and anything that does not
+finish in time is completed in the background.
+"""
+import asyncio
+import logging
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable
+
+from .outbox import outbox, PermanentFailure
+
+logger = logging.getLogger("uvicorn.error")
+
+
+@dataclass
+class SagaStep:
+    name: str
+    action: Callable[[], Awaitable[Any]]
+    # Receives the action's result; must be safe to call more than once
+    compensate: Callable[[Any], Awaitable[None]] | None = None
+
+
+@dataclass
+class FollowUp:
+    kind: str
+    payload: dict
+
+
+@dataclass
+class SagaResult:
+    results: dict[str, Any] = field(default_factory=dict)
+    # Follow-ups attempted inline that completed, keyed by outbox kind
+    completed: dict[str, Any] = field(default_factory=dict)
+    pending: list[str] = field(default_factory=list)
+    # Follow-ups that failed permanently (dead-lettered), with the error
+    failed: dict[str, str] = field(default_factory=dict)
+
+
+class Saga:
+
+    def __init__(self, name: str):
+        self.name = name
+        self.steps: list[SagaStep] = []
+        self.follow_ups: list[FollowUp] = []
+
+    def step(self, name: str, action, compensate=None) -> "Saga":
+        self.steps.append(SagaStep(name, action, compensate))
+        return self
+
+    def then(self, kind: str, payload: dict) -> "Saga":
+        self.follow_ups.append(FollowUp(kind, payload))
+        return self
+
+    async def _compensate(self, done: list[tuple[SagaStep, Any]]):
+        for step, result in reversed(done):
+            if step.compensate is None:
+                continue
+            try:
+                await step.compensate(result)
+            except Exception:
+                logger.exception("Saga %s: compensation of %s failed", self.name, step.name)
+
+    async def run(self, inline_timeout: float = 0.0) -> SagaResult:
+        outcome = SagaResult()
+        done: list[tuple[SagaStep, Any]] = []
+        for step in self.steps:
+            try:
+                result = await step.action()
+            except BaseException:
+                await self._compensate(done)
+                raise
+            done.append((step, result))
+            outcome.results[step.name] = result
+
+        for follow_up in self.follow_ups:
+            if inline_timeout <= 0:
+                await outbox.enqueue(follow_up.kind, follow_up.payload)
+                outcome.pending.append(follow_up.kind)
+                continue
+
+            # Keep the worker off the job while it is being attempted inline.
+            job_id = await outbox.enqueue(follow_up.kind, follow_up.payload, delay=inline_timeout + 1.0)
+            try:
+                outcome.completed[follow_up.kind] = await asyncio.wait_for(
+                    outbox.run_now(job_id, follow_up.kind, follow_up.payload),
+                    timeout=inline_timeout,
+                )
+            except PermanentFailure as e:
+                logger.error("Saga %s: %s failed permanently: %s", self.name, follow_up.kind, e)
+                outcome.failed[follow_up.kind] = str(e)
+            except Exception as e:
+                logger.warning("Saga %s: %s deferred to the outbox: %r", self.name, follow_up.kind, e)
+                outcome.pending.append(follow_up.kind)
+        return outcome
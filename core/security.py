@@ -2,18 +2,18 @@ from fastapi import HTTPException, Depends
 from fastapi.security import HTTPBearer
 import jwt
 
-from .config import settings
+from .access_log import annotate
+from .tokens import token_verifier, KeySetUnavailable
 
 security = HTTPBearer()
 
-ALGORITHM = "HS256"
-
-def verify_jwt(credentials = Depends(security)):
+async def verify_jwt(credentials = Depends(security)):
     
     token = credentials.credentials
 
     try:
-        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[ALGORITHM])
+        payload = await token_verifier.verify(token)
+        annotate(user_id=payload.get("user_id"))
         return payload
 
     except jwt.ExpiredSignatureError:
@@ -22,6 +22,9 @@ def verify_jwt(credentials = Depends(security)):
     except jwt.InvalidTokenError:
         raise HTTPException(status_code=401, detail="Invalid token")
 
+    except KeySetUnavailable:
+        raise HTTPException(status_code=503, detail="Token signing keys unavailable")
+
 
 def require_complete_profile(payload: dict = Depends(verify_jwt)):
 
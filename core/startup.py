@@ -0,0 +1,90 @@
+"""Startup timing report and warm-up of upstream connections."""
+import asyncio
+import logging
+import time
+from contextlib import contextmanager
+
+import httpx
+
+from .config import settings, get_settings
+from .upstream import get_client
+
+# uvicorn configures this logger (serve.py does under Hypercorn), so the report shows up without extra setup
+logger = logging.getLogger("uvicorn.error")
+
+
+class StartupProfile:
+    """Records how long each import / initialisation step of the gateway took."""
+
+    def __init__(self):
+        self.started_at = time.perf_counter()
+        self.steps: list[tuple[str, float]] = []
+        self.ready_at: float | None = None
+
+    @contextmanager
+    def step(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.steps.append((name, time.perf_counter() - start))
+
+    def mark_ready(self):
+        self.ready_at = time.perf_counter()
+
+    def report(self) -> dict:
+        total = (self.ready_at or time.perf_counter()) - self.started_at
+        return {
+            "total_ms": round(total * 1000, 1),
+            "ready": self.ready_at is not None,
+            "steps": [{"step": name, "ms": round(seconds * 1000, 1)} for name, seconds in self.steps],
+        }
+
+    def log(self):
+        report = self.report()
+        logger.info("Gateway started in %.1f ms", report["total_ms"])
+        for step in report["steps"]:
+            logger.info("  %-40s %8.1f ms", step["step"], step["ms"])
+
+
+startup_profile = StartupProfile()
+
+
+async def _warm_service(base_url: str, connections: int):
+    """Open `connections` pooled connections to an upstream (any answer will do)."""
+    client = get_client()
+
+    async def touch():
+        try:
+            await client.get(f"{base_url}/", timeout=settings.WARMUP_TIMEOUT)
+        except httpx.HTTPError:
+            pass
+
+    await asyncio.gather(*(touch() for _ in range(connections)))
+
+
+async def warm_up():
+    """Run the startup steps that would otherwise slow down the first requests."""
+    with startup_profile.step("load settings"):
+        get_settings()
+
+    if not settings.WARMUP_ENABLED:
+        return
+
+    if settings.JWKS_URL or settings.JWKS_FILE:
+        from .tokens import token_verifier, KeySetUnavailable
+        with startup_profile.step("load JWKS"):
+            try:
+                await token_verifier.key_set.refresh()
+            except KeySetUnavailable as e:
+                logger.warning("JWKS not loaded at startup: %s", e)
+
+    from .discovery import registry, service_urls
+    with startup_profile.step("discover upstream endpoints"):
+        await registry.refresh()
+
+    services = service_urls()
+    with startup_profile.step("warm upstream connection pools"):
+        await asyncio.gather(*(
+            _warm_service(url, settings.WARMUP_CONNECTIONS) for url in services.values()
+        ))
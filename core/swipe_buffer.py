@@ -0,0 +1,152 @@
+"""Buffered, asynchronous submission of swipes that cannot create a match.
+
+Left swipes ("pass") are acknowledged immediately and queued per user; the
+queues are flushed to the matching service in batches, in the order they
+were made. Right swipes still go through synchronously (after flushing the
+user's pending swipes) because the client needs the match result.
+
+When a user's queue is full and an inline flush cannot empty it (matching
+service down), further passes are rejected with SwipeBufferFull instead of
+being acknowledged. On shutdown everything still queued is flushed; swipes
+that still cannot be delivered are handed to the durable outbox.
+
+Drains run in a fresh context so they are not bound by the deadline (or
+access-log entry) of the request that happened to start them.
+"""
+import asyncio
+import contextvars
+import logging
+from collections import deque
+
+import httpx
+
+from .config import settings, LazyObject
+from .deadline import DeadlineExceeded
+from .outbox import outbox, register as outbox_handler
+from .upstream import get_client
+
+logger = logging.getLogger("uvicorn.error")
+
+PASS_ACTIONS = {"dislike", "pass", "left", "no", "reject", "nope"}
+
+
+def is_match_critical(swipe_data: dict) -> bool:
+    """True unless the swipe is recognisably a pass. Unknown shapes stay synchronous."""
+    for key in ("action", "direction", "swipe_type", "type"):
+        value = swipe_data.get(key)
+        if isinstance(value, str):
+            return value.lower() not in PASS_ACTIONS
+    for key in ("liked", "is_like", "like"):
+        if isinstance(swipe_data.get(key), bool):
+            return swipe_data[key]
+    return True
+
+
+async def send_swipe(user_id: int, swipe_data: dict) -> httpx.Response:
+    return await get_client().post(
+        f"{settings.MATCHING_SERVICE_URL}/matching/swipe",
+        params={"current_user_id": user_id},
+        json=swipe_data,
+    )
+
+
+@outbox_handler("matching.swipe")
+async def _deliver_from_outbox(payload: dict):
+    res = await send_swipe(payload["user_id"], payload["swipe"])
+    if res.status_code >= 500:
+        raise RuntimeError(f"Matching service answered {res.status_code}")
+
+
+class SwipeBufferFull(Exception):
+    """The user's queue is full and could not be flushed."""
+
+
+class SwipeBuffer:
+
+    def __init__(self, max_per_user: int, batch_size: int, concurrency: int):
+        self.max_per_user = max_per_user
+        self.batch_size = batch_size
+        self._queues: dict[int, deque] = {}
+        # At most one drain per user at a time, so swipes keep their order
+        self._draining: dict[int, asyncio.Task] = {}
+        self._background: set[asyncio.Task] = set()
+        self._semaphore = asyncio.Semaphore(concurrency)
+
+    def pending(self, user_id: int) -> int:
+        return len(self._queues.get(user_id, ()))
+
+    async def submit(self, user_id: int, swipe_data: dict):
+        queue = self._queues.setdefault(user_id, deque())
+        if len(queue) >= self.max_per_user:
+            # Bounded queue: make room by flushing this user inline.
+            await self.flush_user(user_id)
+            queue = self._queues.setdefault(user_id, deque())
+            if len(queue) >= self.max_per_user:
+                raise SwipeBufferFull()
+        queue.append(swipe_data)
+        if len(queue) >= self.batch_size:
+            task = asyncio.get_running_loop().create_task(
+                self.flush_user(user_id), context=contextvars.Context()
+            )
+            self._background.add(task)
+            task.add_done_callback(self._background.discard)
+
+    async def flush_user(self, user_id: int):
+        """Send the user's queued swipes in order. Failed ones stay queued."""
+        while user_id in self._draining:
+            await asyncio.shield(self._draining[user_id])
+        if not self._queues.get(user_id):
+            return
+
+        task = asyncio.get_running_loop().create_task(
+            self._drain(user_id), context=contextvars.Context()
+        )
+        self._draining[user_id] = task
+        task.add_done_callback(lambda _: self._draining.pop(user_id, None))
+        await asyncio.shield(task)
+
+    async def _drain(self, user_id: int):
+        queue = self._queues.get(user_id)
+        while queue:
+            swipe_data = queue[0]
+            try:
+                async with self._semaphore:
+                    res = await send_swipe(user_id, swipe_data)
+            except (httpx.RequestError, DeadlineExceeded) as e:
+                logger.warning("Swipe flush for user %s failed: %r", user_id, e)
+                return
+            if res.status_code >= 500:
+                logger.warning("Swipe flush for user %s got %s", user_id, res.status_code)
+                return
+            if res.status_code not in (200, 201):
+                # Rejected (e.g. duplicate swipe): retrying would not help.
+                logger.info("Dropped swipe of user %s: %s %s", user_id, res.status_code, res.text[:200])
+            queue.popleft()
+        if not queue:
+            self._queues.pop(user_id, None)
+
+    async def flush_all(self):
+        await asyncio.gather(*(self.flush_user(uid) for uid in list(self._queues)))
+
+    async def run_flusher(self):
+        while True:
+            await asyncio.sleep(settings.SWIPE_FLUSH_INTERVAL)
+            try:
+                await self.flush_all()
+            except Exception:
+                logger.exception("Swipe flush failed")
+
+    async def shutdown(self):
+        """Final flush; whatever still cannot be delivered goes to the outbox."""
+        await self.flush_all()
+        for user_id, queue in list(self._queues.items()):
+            for swipe_data in queue:
+                await outbox.enqueue("matching.swipe", {"user_id": user_id, "swipe": swipe_data})
+        self._queues.clear()
+
+
+swipe_buffer = LazyObject(lambda: SwipeBuffer(
+    max_per_user=settings.SWIPE_BUFFER_MAX_PER_USER,
+    batch_size=settings.SWIPE_BATCH_SIZE,
+    concurrency=settings.SWIPE_FLUSH_CONCURRENCY,
+))
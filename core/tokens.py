@@ -0,0 +1,134 @@
+"""Access token verification shared by the HTTP dependencies and the WebSocket.
+
+HS256 tokens are checked against SECRET_KEY. RS256/ES256 tokens are checked
+against a JSON Web Key Set (JWKS_URL, or JWKS_FILE for tests/local setups)
+that is cached, refreshed every JWKS_REFRESH_INTERVAL seconds and re-read
+when a token names an unknown `kid`, so the auth service can rotate keys
+without restarting the gateway. Asymmetric signature checks run in a small
+thread pool to keep them off the event loop.
+"""
+import asyncio
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+import jwt
+
+from .config import settings, LazyObject
+from .upstream import get_client
+
+ASYMMETRIC_ALGORITHMS = {"RS256", "ES256"}
+
+# Loads are attempted at most this often, whether the last one succeeded or
+# failed, so forged tokens (unknown kids, or any asymmetric token while the
+# key endpoint is down) cannot be used to hammer the key endpoint.
+MIN_FORCED_REFRESH_INTERVAL = 30.0
+
+
+class KeySetUnavailable(Exception):
+    """No signing keys could be loaded to verify an asymmetric token."""
+
+
+class KeySet:
+
+    def __init__(self, url: str | None, path: str | None, refresh_interval: float):
+        self.url = url
+        self.path = path
+        self.refresh_interval = refresh_interval
+        self._keys: dict[str, jwt.PyJWK] = {}
+        self._loaded_at = 0.0
+        self._attempted_at: float | None = None
+        self._lock = asyncio.Lock()
+
+    async def _load(self) -> dict:
+        if self.path:
+            return await asyncio.to_thread(_read_json, self.path)
+        if self.url:
+            res = await get_client().get(self.url)
+            res.raise_for_status()
+            return res.json()
+        raise KeySetUnavailable("Neither JWKS_URL nor JWKS_FILE is configured")
+
+    async def refresh(self, force: bool = False):
+        async with self._lock:
+            now = time.monotonic()
+            if not force and now - self._loaded_at < self.refresh_interval:
+                return  # another request refreshed while we were waiting
+            if self._attempted_at is not None and now - self._attempted_at < MIN_FORCED_REFRESH_INTERVAL:
+                return
+            self._attempted_at = now
+            try:
+                key_set = jwt.PyJWKSet.from_dict(await self._load())
+            except Exception as e:
+                if not self._keys:
+                    raise KeySetUnavailable(str(e)) from e
+                # Keep serving with the keys we already have.
+                self._loaded_at = time.monotonic()
+                return
+            self._keys = {key.key_id: key for key in key_set.keys if key.key_id}
+            self._loaded_at = time.monotonic()
+
+    async def get(self, kid: str | None) -> jwt.PyJWK:
+        if time.monotonic() - self._loaded_at >= self.refresh_interval:
+            await self.refresh()
+        if not self._keys:
+            # Nothing loaded and the last attempt was too recent to retry.
+            raise KeySetUnavailable("No signing keys loaded")
+
+        if kid is None and len(self._keys) == 1:
+            return next(iter(self._keys.values()))
+        key = self._keys.get(kid)
+        if key is None:
+            await self.refresh(force=True)
+            key = self._keys.get(kid)
+        if key is None:
+            raise jwt.InvalidTokenError("Unknown signing key")
+        return key
+
+
+class TokenVerifier:
+
+    def __init__(self, algorithms: list[str], key_set: KeySet, workers: int):
+        self.algorithms = algorithms
+        self.key_set = key_set
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="jwt-verify")
+
+    async def verify(self, token: str) -> dict:
+        """Return the token claims, raising `jwt.InvalidTokenError` subclasses.
+
+        `user_id` is always present in the result: tokens carrying the id only
+        in `sub` are normalised so every caller reads the same claim.
+        """
+        header = jwt.get_unverified_header(token)
+        algorithm = header.get("alg")
+        if algorithm not in self.algorithms:
+            raise jwt.InvalidAlgorithmError("Algorithm not allowed")
+
+        if algorithm in ASYMMETRIC_ALGORITHMS:
+            key = await self.key_set.get(header.get("kid"))
+            decode = partial(jwt.decode, token, key.key, algorithms=[algorithm])
+            payload = await asyncio.get_running_loop().run_in_executor(self._executor, decode)
+        else:
+            payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[algorithm])
+
+        return normalize_claims(payload)
+
+
+def _read_json(path: str) -> dict:
+    with open(path) as f:
+        return json.load(f)
+
+
+def normalize_claims(payload: dict) -> dict:
+    if payload.get("user_id") is None and payload.get("sub") is not None:
+        sub = payload["sub"]
+        payload["user_id"] = int(sub) if isinstance(sub, str) and sub.isdigit() else sub
+    return payload
+
+
+token_verifier = LazyObject(lambda: TokenVerifier(
+    algorithms=settings.JWT_ALGORITHMS,
+    key_set=KeySet(settings.JWKS_URL, settings.JWKS_FILE, settings.JWKS_REFRESH_INTERVAL),
+    workers=settings.JWT_VERIFY_WORKERS,
+))
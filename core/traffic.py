@@ -0,0 +1,322 @@
+"""Traffic capture (for scripts/replay.py) and shadow reads.
+
+`CaptureMiddleware` records a sample (CAPTURE_SAMPLE_RATE) of proxied
+HTTP exchanges to CAPTURE_FILE as JSON lines, through the same batched
+off-loop writer as the access log. Credentials are never written:
+auth/cookie headers are dropped and sensitive JSON keys and query
+parameters (any name containing token, password, secret or key) are masked.
+
+Shadow mode mirrors SHADOW_SAMPLE_RATE of the upstream GETs made through
+the shared client to the candidate base URL configured for that service
+in SHADOW_UPSTREAMS. The mirror runs in a background task on its own
+client after the primary response is back, so clients never wait for it;
+status, body and latency differences are aggregated in `shadow.report()`.
+The primary body is never read by the hook: it is teed while the caller
+consumes it, and bodies larger than SHADOW_MAX_BODY (or closed unread,
+e.g. streamed lists) are compared by status and latency only.
+"""
+import asyncio
+import json
+import logging
+import random
+import time
+from urllib.parse import parse_qsl, urlencode
+
+import httpx
+
+from .access_log import AccessLog
+from .config import LazyObject, settings
+from .discovery import registry
+
+logger = logging.getLogger("uvicorn.error")
+
+SENSITIVE_KEYS = {
+    "email", "phone",
+    "input",  # validation errors echo the raw request value
+}
+# Any key containing one of these is masked (turnstile_token, api_key, ...)
+SENSITIVE_KEY_PARTS = ("token", "password", "secret", "key")
+CAPTURED_HEADERS = {"content-type", "accept", "accept-encoding", "if-none-match"}
+MASK = "***"
+
+
+def is_sensitive(key: str) -> bool:
+    key = key.lower()
+    return key in SENSITIVE_KEYS or any(part in key for part in SENSITIVE_KEY_PARTS)
+
+
+def sanitize(value):
+    """Mask sensitive keys anywhere in a decoded JSON document."""
+    if isinstance(value, dict):
+        return {k: MASK if is_sensitive(k) else sanitize(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [sanitize(v) for v in value]
+    return value
+
+
+def _sanitize_query(query: str) -> str:
+    pairs = parse_qsl(query, keep_blank_values=True)
+    return urlencode([(k, MASK if is_sensitive(k) else v) for k, v in pairs])
+
+
+def _body_sample(body: bytes, content_type: str, truncated: bool):
+    if not body:
+        return None
+    if truncated:
+        return {"omitted": True, "bytes": len(body)}
+    if "json" in content_type:
+        try:
+            return {"json": sanitize(json.loads(body))}
+        except ValueError:
+            pass
+    if content_type.startswith("text/"):
+        return {"text": body.decode("utf-8", "replace")}
+    return {"omitted": True, "bytes": len(body)}
+
+
+class _Collector:
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.chunks: list[bytes] = []
+        self.size = 0
+
+    def add(self, chunk: bytes):
+        self.size += len(chunk)
+        if self.size <= self.limit:
+            self.chunks.append(chunk)
+
+    @property
+    def truncated(self) -> bool:
+        return self.size > self.limit
+
+    def body(self) -> bytes:
+        return b"".join(self.chunks)
+
+
+class CaptureMiddleware:
+
+    def __init__(self, app, path_prefixes: tuple[str, ...]):
+        self.app = app
+        self.path_prefixes = path_prefixes
+
+    async def __call__(self, scope, receive, send):
+        if (
+            scope["type"] != "http"
+            or not settings.CAPTURE_ENABLED
+            or not scope["path"].startswith(self.path_prefixes)
+            or random.random() >= settings.CAPTURE_SAMPLE_RATE
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        request_body = _Collector(settings.CAPTURE_MAX_BODY)
+        response_body = _Collector(settings.CAPTURE_MAX_BODY)
+        response_meta = {"status": None, "content_type": ""}
+
+        async def receive_wrapper():
+            message = await receive()
+            if message["type"] == "http.request":
+                request_body.add(message.get("body", b""))
+            return message
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                response_meta["status"] = message["status"]
+                for name, value in message.get("headers", []):
+                    if name.lower() == b"content-type":
+                        response_meta["content_type"] = value.decode("latin-1")
+            elif message["type"] == "http.response.body":
+                response_body.add(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, receive_wrapper, send_wrapper)
+        finally:
+            headers = {
+                name.decode("latin-1").lower(): value.decode("latin-1")
+                for name, value in scope["headers"]
+            }
+            captured_headers = {k: v for k, v in headers.items() if k in CAPTURED_HEADERS}
+            capture_log.write({
+                "ts": round(time.time(), 3),
+                "method": scope["method"],
+                "path": scope["path"],
+                "query": _sanitize_query(scope.get("query_string", b"").decode("latin-1")),
+                "headers": captured_headers,
+                "authenticated": "authorization" in headers,
+                "body": _body_sample(
+                    request_body.body(), headers.get("content-type", ""), request_body.truncated
+                ),
+                "status": response_meta["status"],
+                "response": _body_sample(
+                    response_body.body(), response_meta["content_type"], response_body.truncated
+                ),
+                "duration_ms": round((time.perf_counter() - started) * 1000, 1),
+            })
+
+
+capture_log = LazyObject(lambda: AccessLog(
+    path=settings.CAPTURE_FILE,
+    max_bytes=settings.ACCESS_LOG_MAX_BYTES,
+    backup_count=settings.ACCESS_LOG_BACKUP_COUNT,
+    queue_size=settings.ACCESS_LOG_QUEUE_SIZE,
+    batch_size=settings.ACCESS_LOG_BATCH_SIZE,
+))
+
+
+class ShadowTraffic:
+
+    def __init__(self, max_in_flight: int, timeout: float):
+        self.max_in_flight = max_in_flight
+        self.timeout = timeout
+        self._client: httpx.AsyncClient | None = None
+        self._tasks: set[asyncio.Task] = set()
+        self.stats = {
+            "mirrored": 0,
+            "skipped": 0,
+            "errors": 0,
+            "status_mismatches": 0,
+            "body_mismatches": 0,
+            "primary_ms_total": 0.0,
+            "shadow_ms_total": 0.0,
+        }
+
+    def candidate_url(self, request: httpx.Request) -> str | None:
+        service = registry.service_for(request.url)
+        if service is None:
+            return None
+        candidate = settings.SHADOW_UPSTREAMS.get(service.name)
+        if not candidate:
+            return None
+        return str(httpx.URL(candidate).join(request.url.raw_path.decode("ascii")))
+
+    def mirror(self, request: httpx.Request, candidate: str, status: int, body: bytes | None, primary_ms: float):
+        """Compare with the candidate; `body` None means compare status and latency only."""
+        if len(self._tasks) >= self.max_in_flight:
+            self.stats["skipped"] += 1
+            return
+        task = asyncio.create_task(self._compare(request, candidate, status, body, primary_ms))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _compare(self, request, candidate, status, body, primary_ms):
+        if self._client is None:
+            self._client = httpx.AsyncClient(timeout=self.timeout)
+        headers = {
+            k: v for k, v in request.headers.items()
+            if k.lower() not in ("host", "content-length", "x-deadline-ms")
+        }
+        started = time.perf_counter()
+        try:
+            async with self._client.stream("GET", candidate, headers=headers) as res:
+                shadow_ms = (time.perf_counter() - started) * 1000
+                shadow_body = await res.aread() if body is not None else None
+        except httpx.HTTPError as e:
+            self.stats["errors"] += 1
+            logger.info("Shadow GET %s failed: %r", candidate, e)
+            return
+
+        self.stats["mirrored"] += 1
+        self.stats["primary_ms_total"] += primary_ms
+        self.stats["shadow_ms_total"] += shadow_ms
+        if res.status_code != status:
+            self.stats["status_mismatches"] += 1
+            logger.info("Shadow status mismatch on %s: %s vs %s", request.url.path, status, res.status_code)
+        elif body is not None and not _same_body(body, shadow_body):
+            self.stats["body_mismatches"] += 1
+            logger.info("Shadow body mismatch on %s", request.url.path)
+
+    def report(self) -> dict:
+        mirrored = self.stats["mirrored"]
+        report = {k: v for k, v in self.stats.items() if not k.endswith("_total")}
+        report["in_flight"] = len(self._tasks)
+        if mirrored:
+            report["primary_ms_avg"] = round(self.stats["primary_ms_total"] / mirrored, 1)
+            report["shadow_ms_avg"] = round(self.stats["shadow_ms_total"] / mirrored, 1)
+        return report
+
+    async def close(self):
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+def _same_body(primary: bytes, shadow: bytes) -> bool:
+    if primary == shadow:
+        return True
+    try:
+        return json.loads(primary) == json.loads(shadow)
+    except ValueError:
+        return False
+
+
+shadow = LazyObject(lambda: ShadowTraffic(
+    max_in_flight=settings.SHADOW_MAX_IN_FLIGHT,
+    timeout=settings.SHADOW_TIMEOUT,
+))
+
+
+async def tag_shadow(request: httpx.Request):
+    """httpx request hook: pick the GETs to mirror, before load balancing."""
+    if (
+        request.method != "GET"
+        or not settings.SHADOW_UPSTREAMS
+        or random.random() >= settings.SHADOW_SAMPLE_RATE
+    ):
+        return
+    candidate = shadow.candidate_url(request)
+    if candidate:
+        request.extensions["shadow"] = (candidate, time.perf_counter())
+
+
+class _TeeStream(httpx.AsyncByteStream):
+    """Keeps a bounded copy of the body the caller reads; mirrors on close."""
+
+    def __init__(self, stream, response: httpx.Response, candidate: str, primary_ms: float):
+        self._stream = stream
+        self._response = response
+        self._candidate = candidate
+        self._primary_ms = primary_ms
+        self._body = _Collector(settings.SHADOW_MAX_BODY)
+        self._complete = False
+        self._mirrored = False
+
+    async def __aiter__(self):
+        async for chunk in self._stream:
+            self._body.add(chunk)
+            yield chunk
+        self._complete = True
+
+    async def aclose(self):
+        try:
+            await self._stream.aclose()
+        finally:
+            if not self._mirrored:
+                self._mirrored = True
+                body = self._body.body() if self._complete and not self._body.truncated else None
+                shadow.mirror(
+                    self._response.request, self._candidate, self._response.status_code,
+                    body, self._primary_ms,
+                )
+
+
+async def mirror_shadow(response: httpx.Response):
+    """httpx response hook: mirror a tagged GET once the caller is done with it."""
+    tagged = response.request.extensions.get("shadow")
+    if tagged is None:
+        return
+    candidate, started = tagged
+    primary_ms = (time.perf_counter() - started) * 1000
+    if response.is_closed:
+        # Already buffered (e.g. by the transport); no extra memory to compare it.
+        body = getattr(response, "_content", None)
+        if body is not None and len(body) > settings.SHADOW_MAX_BODY:
+            body = None
+        shadow.mirror(response.request, candidate, response.status_code, body, primary_ms)
+        return
+    response.stream = _TeeStream(response.stream, response, candidate, primary_ms)
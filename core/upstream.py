@@ -0,0 +1,40 @@
+"""Shared HTTP client used by the routers to talk to the upstream services."""
+import httpx
+
+from .access_log import record_upstream_call, record_upstream_start
+from .deadline import apply_deadline
+from .discovery import BalancingTransport
+from .json_stream import enforce_response_limit
+from .traffic import mirror_shadow, tag_shadow
+
+# Upper bound only: each call is further clamped to its request's deadline.
+DEFAULT_TIMEOUT = httpx.Timeout(30.0)
+DEFAULT_LIMITS = httpx.Limits(max_connections=200, max_keepalive_connections=50)
+
+_client: httpx.AsyncClient | None = None
+
+
+def get_client() -> httpx.AsyncClient:
+    """Return the process-wide AsyncClient, creating it on first use.
+
+    Reusing one client keeps upstream connections alive between requests
+    instead of paying a new TCP handshake for every proxied call.
+    """
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(
+            timeout=DEFAULT_TIMEOUT,
+            transport=BalancingTransport(httpx.AsyncHTTPTransport(limits=DEFAULT_LIMITS)),
+            event_hooks={
+                "request": [apply_deadline, record_upstream_start, tag_shadow],
+                "response": [enforce_response_limit, record_upstream_call, mirror_shadow],
+            },
+        )
+    return _client
+
+
+async def close_client():
+    global _client
+    if _client is not None and not _client.is_closed:
+        await _client.aclose()
+    _client = None
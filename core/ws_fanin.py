@@ -0,0 +1,156 @@
+"""One upstream chat WebSocket per (user_id, relationship_id), shared by devices.
+
+When a user has the same chat open on several devices, every local client
+socket joins the same `ChatSession`: its upstream socket is opened once,
+each upstream message is relayed (and fed to the message cache) once and
+fanned out to the per-client bounded queues. A client that falls
+WS_CLIENT_QUEUE_SIZE messages behind is disconnected (it reloads history
+on reconnect) instead of stalling the others or dropping messages
+silently. The upstream socket is reference counted and closed
+WS_FANIN_LINGER seconds after the last client leaves, so a quick reconnect
+reuses it.
+"""
+import asyncio
+import logging
+from typing import Awaitable, Callable
+
+from .config import LazyObject, settings
+from .message_cache import message_cache
+
+logger = logging.getLogger("uvicorn.error")
+
+# Sentinels put on a client queue instead of a message.
+UPSTREAM_CLOSED = None
+CLIENT_TOO_SLOW = object()
+
+
+class ChatSession:
+
+    def __init__(self, key: tuple[int, int], upstream, manager: "ChatSessions"):
+        self.key = key
+        self.upstream = upstream
+        self.clients: set[asyncio.Queue] = set()
+        self.closed = False
+        self._manager = manager
+        self._send_lock = asyncio.Lock()
+        self._linger: asyncio.TimerHandle | None = None
+        self._reader = asyncio.create_task(self._read_upstream())
+
+    def attach(self, queue_size: int) -> asyncio.Queue:
+        if self._linger is not None:
+            self._linger.cancel()
+            self._linger = None
+        queue = asyncio.Queue(maxsize=queue_size)
+        self.clients.add(queue)
+        return queue
+
+    def detach(self, queue: asyncio.Queue, linger: float):
+        self.clients.discard(queue)
+        if not self.clients and not self.closed:
+            loop = asyncio.get_running_loop()
+            self._linger = loop.call_later(linger, lambda: asyncio.ensure_future(self.close()))
+
+    async def send(self, data: str):
+        async with self._send_lock:
+            await self.upstream.send(data)
+
+    async def _read_upstream(self):
+        try:
+            async for message in self.upstream:
+                message_cache.observe_relayed(message)
+                for queue in list(self.clients):
+                    self._deliver(queue, message)
+        except Exception as e:
+            logger.info("Upstream chat socket %s ended: %r", self.key, e)
+        finally:
+            self._manager.forget(self)
+            self.closed = True
+            for queue in list(self.clients):
+                self._deliver(queue, UPSTREAM_CLOSED)
+
+    def _deliver(self, queue: asyncio.Queue, message):
+        if queue.full():
+            # Too slow: replace its backlog with a disconnect request.
+            while not queue.empty():
+                queue.get_nowait()
+            self.clients.discard(queue)
+            message = CLIENT_TOO_SLOW
+        queue.put_nowait(message)
+
+    async def close(self):
+        self._manager.forget(self)
+        self.closed = True
+        if self._linger is not None:
+            self._linger.cancel()
+            self._linger = None
+        try:
+            await self.upstream.close()
+        except Exception:
+            pass
+        self._reader.cancel()
+        await asyncio.gather(self._reader, return_exceptions=True)
+
+
+class ChatSessions:
+
+    def __init__(self, queue_size: int, linger: float):
+        self.queue_size = queue_size
+        self.linger = linger
+        self._sessions: dict[tuple[int, int], ChatSession] = {}
+        self._connecting: dict[tuple[int, int], asyncio.Future] = {}
+
+    async def join(
+        self, user_id: int, relationship_id: int, connect: Callable[[], Awaitable]
+    ) -> tuple[ChatSession, asyncio.Queue]:
+        """Attach a client to the user's session, opening the upstream if needed.
+
+        Concurrent joins for the same key share a single `connect()` call.
+        """
+        key = (int(user_id), int(relationship_id))
+        while True:
+            session = self._sessions.get(key)
+            if session is not None and not session.closed:
+                return session, session.attach(self.queue_size)
+
+            pending = self._connecting.get(key)
+            if pending is not None:
+                # Shielded so a client that gives up does not cancel the
+                # connect others are waiting on; loop to attach to the result.
+                await asyncio.shield(pending)
+                continue
+
+            pending = asyncio.get_running_loop().create_future()
+            self._connecting[key] = pending
+            try:
+                upstream = await connect()
+                session = ChatSession(key, upstream, self)
+                self._sessions[key] = session
+                pending.set_result(None)
+            except asyncio.CancelledError:
+                # Let the waiters retry the connect themselves.
+                pending.set_result(None)
+                raise
+            except BaseException as e:
+                pending.set_exception(e)
+                # Waiters re-raise it; mark it retrieved for the case of none.
+                pending.exception()
+                raise
+            finally:
+                self._connecting.pop(key, None)
+            return session, session.attach(self.queue_size)
+
+    def leave(self, session: ChatSession, queue: asyncio.Queue):
+        session.detach(queue, self.linger)
+
+    def forget(self, session: ChatSession):
+        if self._sessions.get(session.key) is session:
+            del self._sessions[session.key]
+
+    async def close_all(self):
+        await asyncio.gather(*(s.close() for s in list(self._sessions.values())))
+
+
+chat_sessions = LazyObject(lambda: ChatSessions(
+    queue_size=settings.WS_CLIENT_QUEUE_SIZE,
+    linger=settings.WS_FANIN_LINGER,
+))
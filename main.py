@@ -1,13 +1,66 @@
+import asyncio
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 import os
-from routers.auth_proxy import router as auth_router
-from routers.user_proxy import router as user_router
-from routers.home_router import router as home_router
-from routers.matching_proxy import router as matching_router
-from routers.chat_proxy import router as chat_router
+from core.config import settings
+from core.startup import startup_profile, warm_up
 
-app = FastAPI(title="API Gateway")
+with startup_profile.step("import core middlewares"):
+    from core.upstream import close_client
+    from core.deadline import DeadlineMiddleware
+    from core.etag import ETagMiddleware
+    from core.compression import CompressionMiddleware
+    from core.admission import AdmissionMiddleware
+    from core.access_log import AccessLogMiddleware, access_log
+    from core.outbox import outbox
+    from core.swipe_buffer import swipe_buffer
+    from core.discovery import registry
+    from core.traffic import CaptureMiddleware, capture_log, shadow
+    from core.ws_fanin import chat_sessions
+    from core.connection_metrics import ConnectionMetricsMiddleware, connection_metrics
+
+with startup_profile.step("import routers.auth_proxy"):
+    from routers.auth_proxy import router as auth_router
+with startup_profile.step("import routers.user_proxy"):
+    from routers.user_proxy import router as user_router
+with startup_profile.step("import routers.home_router"):
+    from routers.home_router import router as home_router
+with startup_profile.step("import routers.matching_proxy"):
+    from routers.matching_proxy import router as matching_router
+with startup_profile.step("import routers.chat_proxy"):
+    from routers.chat_proxy import router as chat_router
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Settings are validated here (not at import) and pools/caches are
+    # warmed before the first real request arrives.
+    await warm_up()
+    with startup_profile.step("open outbox"):
+        outbox_worker = asyncio.create_task(outbox.run_worker())
+    swipe_flusher = asyncio.create_task(swipe_buffer.run_flusher())
+    discovery_refresher = asyncio.create_task(registry.run_refresher())
+    access_log.start()
+    if settings.CAPTURE_ENABLED:
+        capture_log.start()
+    startup_profile.mark_ready()
+    startup_profile.log()
+    yield
+    discovery_refresher.cancel()
+    swipe_flusher.cancel()
+    await asyncio.gather(discovery_refresher, swipe_flusher, return_exceptions=True)
+    await swipe_buffer.shutdown()
+    outbox_worker.cancel()
+    await asyncio.gather(outbox_worker, return_exceptions=True)
+    await chat_sessions.close_all()
+    await shadow.close()
+    await close_client()
+    access_log.stop()
+    capture_log.stop()
+
+
+app = FastAPI(title="API Gateway", lifespan=lifespan)
 
 # CORS for React (configurable via env for prod)
 # Example: CORS_ALLOW_ORIGINS="http://localhost:3000,https://tu-dominio.com"
@@ -21,6 +74,28 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Per-route deadline propagated to upstream calls; cancels reads on client disconnect
+app.add_middleware(DeadlineMiddleware)
+
+PROXY_PREFIXES = ("/auth", "/user", "/home", "/matching", "/chat")
+
+# Sampled capture of proxied exchanges for scripts/replay.py
+app.add_middleware(CaptureMiddleware, path_prefixes=PROXY_PREFIXES)
+
+# Conditional GETs and compression for the proxy routers (compression is the
+# outer layer so ETags are computed on the uncompressed body)
+app.add_middleware(ETagMiddleware, path_prefixes=PROXY_PREFIXES)
+app.add_middleware(CompressionMiddleware, path_prefixes=PROXY_PREFIXES)
+
+# Queue by priority and shed low-priority work under overload
+app.add_middleware(AdmissionMiddleware)
+
+# Around everything else so shed requests and queueing time are logged too
+app.add_middleware(AccessLogMiddleware)
+
+# Client connection reuse / HTTP/2 streams per connection (see serve.py)
+app.add_middleware(ConnectionMetricsMiddleware)
+
 app.include_router(auth_router)
 app.include_router(user_router)
 app.include_router(home_router)
@@ -30,4 +105,19 @@ app.include_router(chat_router)
 
 @app.get("/health")
 def health_check():
-    return {"status": "healthy", "service": "api_gateway"}
\ No newline at end of file
+    return {"status": "healthy", "service": "api_gateway"}
+
+
+@app.get("/health/startup")
+def startup_report():
+    return startup_profile.report()
+
+
+@app.get("/health/shadow")
+def shadow_report():
+    return shadow.report()
+
+
+@app.get("/health/connections")
+def connections_report():
+    return connection_metrics.report()
\ No newline at end of file
@@ -1,5 +1,6 @@
 from fastapi import APIRouter, HTTPException, Request
 from core.config import settings
+from core.upstream import get_client
 import httpx
 from schemas import UserRegister, UserLogin, AuthResponse
 
@@ -8,12 +9,12 @@ router = APIRouter(prefix="/auth", tags=["Auth"])
 @router.post("/register", response_model=AuthResponse)
 async def register_proxy(data: UserRegister, request: Request):
     try:
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            res = await client.post(
-                f"{settings.AUTH_SERVICE_URL}/auth/register", 
-                json=data.model_dump(mode='json'),
-                headers={"X-Forwarded-For": request.client.host}
-            )
+        client = get_client()
+        res = await client.post(
+            f"{settings.AUTH_SERVICE_URL}/auth/register", 
+            json=data.model_dump(mode='json'),
+            headers={"X-Forwarded-For": request.client.host}
+        )
 
         if res.status_code != 200:
             try:
@@ -38,12 +39,12 @@ async def register_proxy(data: UserRegister, request: Request):
 @router.post("/login", response_model=AuthResponse)
 async def login_proxy(data: UserLogin, request: Request):
     try:
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            res = await client.post(
-                f"{settings.AUTH_SERVICE_URL}/auth/login", 
-                json=data.model_dump(),
-                headers={"X-Forwarded-For": request.client.host}
-            )
+        client = get_client()
+        res = await client.post(
+            f"{settings.AUTH_SERVICE_URL}/auth/login", 
+            json=data.model_dump(),
+            headers={"X-Forwarded-For": request.client.host}
+        )
 
         if res.status_code != 200:
             try:
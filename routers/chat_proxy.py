@@ -1,9 +1,19 @@
 from fastapi import APIRouter, HTTPException, Depends, Query, WebSocket, WebSocketDisconnect
 from core.config import settings
 from core.security import get_current_user
-from schemas import ChatListResponse, MessageListResponse
+from core.tokens import token_verifier, KeySetUnavailable
+from core.profile_cache import profile_cache
+from core.models import respond, respond_upstream
+from core.resilience import idempotent_get
+from core.upstream import get_client
+from core.discovery import registry
+from core.deadline import scoped_deadline
+from core.events import event_bus, EVENT_UNREAD_CHANGED
+from core.message_cache import message_cache
+from core.ws_fanin import chat_sessions, CLIENT_TOO_SLOW
+from core.relationship_cache import relationship_cache, RelationshipLookupError
+from schemas import ChatListResponse, ChatInboxResponse, MessageListResponse
 import httpx
-import websockets
 import asyncio
 import json
 import jwt
@@ -11,6 +21,24 @@ import jwt
 router = APIRouter(prefix="/chat", tags=["Chat"])
 
 
+def _chat_id(data) -> int | None:
+    if isinstance(data, dict):
+        for key in ("chat_id", "id"):
+            if data.get(key) is not None:
+                return data[key]
+        if isinstance(data.get("chat"), dict):
+            return _chat_id(data["chat"])
+    return None
+
+
+def _publish_unread_changed(user_id: int, chat_id: int | None, relationship_id: int | None, unread_count: int | None):
+    """Same payload from every source; unread_count None means "changed, re-fetch"."""
+    event_bus.publish(
+        user_id, EVENT_UNREAD_CHANGED,
+        chat_id=chat_id, relationship_id=relationship_id, unread_count=unread_count,
+    )
+
+
 @router.get("/chats", response_model=ChatListResponse)
 async def get_user_chats(
     skip: int = Query(0, ge=0),
@@ -21,11 +49,11 @@ async def get_user_chats(
     user_id = payload["user_id"]
     
     try:
-        async with httpx.AsyncClient() as client:
-            res = await client.get(
-                f"{settings.CHAT_SERVICE_URL}/chats",
-                params={"user_id": user_id, "skip": skip, "limit": limit}
-            )
+        res = await idempotent_get(
+            f"{settings.CHAT_SERVICE_URL}/chats",
+            route="chat.chats",
+            params={"user_id": user_id, "skip": skip, "limit": limit},
+        )
         
         if res.status_code != 200:
             try:
@@ -34,10 +62,54 @@ async def get_user_chats(
                 error_detail = res.text or "Unknown error from chat service"
             raise HTTPException(status_code=res.status_code, detail=error_detail)
         
-        return res.json()
+        return respond_upstream("chat.chats", res)
+    except httpx.RequestError as e:
+        raise HTTPException(status_code=503, detail=f"Chat service unavailable: {str(e)}")
+
+
+@router.get("/inbox", response_model=ChatInboxResponse)
+async def get_chat_inbox(
+    skip: int = Query(0, ge=0),
+    limit: int = Query(20, ge=1, le=100),
+    payload: dict = Depends(get_current_user)
+):
+    """
+    Chat list with partner username/photo already resolved, so the client
+    does not need one `/user/profile/{user_id}` call per chat.
+    """
+    user_id = payload["user_id"]
+
+    try:
+        res = await idempotent_get(
+            f"{settings.CHAT_SERVICE_URL}/chats",
+            route="chat.chats",
+            params={"user_id": user_id, "skip": skip, "limit": limit},
+        )
+
+        if res.status_code != 200:
+            try:
+                error_detail = res.json()
+            except Exception:
+                error_detail = res.text or "Unknown error from chat service"
+            raise HTTPException(status_code=res.status_code, detail=error_detail)
+
+        chat_list = res.json()
     except httpx.RequestError as e:
         raise HTTPException(status_code=503, detail=f"Chat service unavailable: {str(e)}")
 
+    chats = chat_list.get("chats", [])
+    profiles = await profile_cache.get_many(
+        [c["partner_id"] for c in chats],
+        timeout=settings.PROFILE_LOOKUP_TIMEOUT,
+    )
+
+    for chat in chats:
+        profile = profiles.get(chat["partner_id"])
+        chat["partner_username"] = profile.username if profile else None
+        chat["partner_photo_url"] = profile.photo_url if profile else None
+
+    return respond("chat.inbox", {"chats": chats, "total": chat_list.get("total", len(chats))})
+
 
 @router.get("/chats/{chat_id}/messages", response_model=MessageListResponse)
 async def get_messages(
@@ -48,13 +120,18 @@ async def get_messages(
 ):
 
     user_id = payload["user_id"]
+
+    if page == 1:
+        cached = message_cache.get_page(chat_id, user_id, page_size)
+        if cached is not None:
+            return respond("chat.messages", cached)
     
     try:
-        async with httpx.AsyncClient() as client:
-            res = await client.get(
-                f"{settings.CHAT_SERVICE_URL}/chats/{chat_id}/messages",
-                params={"user_id": user_id, "page": page, "page_size": page_size}
-            )
+        res = await idempotent_get(
+            f"{settings.CHAT_SERVICE_URL}/chats/{chat_id}/messages",
+            route="chat.messages",
+            params={"user_id": user_id, "page": page, "page_size": page_size},
+        )
         
         if res.status_code != 200:
             try:
@@ -62,11 +139,16 @@ async def get_messages(
             except:
                 error_detail = res.text or "Unknown error from chat service"
             raise HTTPException(status_code=res.status_code, detail=error_detail)
-        
-        return res.json()
+
+        if page != 1:
+            return respond_upstream("chat.messages", res)
+        result = res.json()
     except httpx.RequestError as e:
         raise HTTPException(status_code=503, detail=f"Chat service unavailable: {str(e)}")
 
+    message_cache.store_page(chat_id, user_id, result)
+    return respond("chat.messages", result)
+
 
 @router.post("/chats/{chat_id}/read")
 async def mark_messages_read(
@@ -77,11 +159,11 @@ async def mark_messages_read(
     user_id = payload["user_id"]
     
     try:
-        async with httpx.AsyncClient() as client:
-            res = await client.post(
-                f"{settings.CHAT_SERVICE_URL}/chats/{chat_id}/read",
-                params={"user_id": user_id}
-            )
+        client = get_client()
+        res = await client.post(
+            f"{settings.CHAT_SERVICE_URL}/chats/{chat_id}/read",
+            params={"user_id": user_id}
+        )
         
         if res.status_code != 200:
             try:
@@ -90,10 +172,15 @@ async def mark_messages_read(
                 error_detail = res.text or "Unknown error from chat service"
             raise HTTPException(status_code=res.status_code, detail=error_detail)
         
-        return res.json()
+        result = res.json()
     except httpx.RequestError as e:
         raise HTTPException(status_code=503, detail=f"Chat service unavailable: {str(e)}")
 
+    message_cache.mark_read(chat_id, user_id)
+    relationship_id = result.get("relationship_id") if isinstance(result, dict) else None
+    _publish_unread_changed(user_id, chat_id, relationship_id, 0)
+    return result
+
 
 @router.get("/chats/by-relationship/{relationship_id}")
 async def get_chat_by_relationship(
@@ -104,11 +191,11 @@ async def get_chat_by_relationship(
     user_id = payload["user_id"]
     
     try:
-        async with httpx.AsyncClient() as client:
-            res = await client.get(
-                f"{settings.CHAT_SERVICE_URL}/chats/by-relationship/{relationship_id}",
-                params={"user_id": user_id}
-            )
+        res = await idempotent_get(
+            f"{settings.CHAT_SERVICE_URL}/chats/by-relationship/{relationship_id}",
+            route="chat.by_relationship",
+            params={"user_id": user_id},
+        )
         
         if res.status_code != 200:
             try:
@@ -122,68 +209,99 @@ async def get_chat_by_relationship(
         raise HTTPException(status_code=503, detail=f"Chat service unavailable: {str(e)}")
 
 
-@router.websocket("/ws/{token}")
-async def websocket_proxy(websocket: WebSocket, token: str):
-
-    await websocket.accept()
-    
-
+async def _authenticate_websocket(websocket: WebSocket, token: str):
+    """Verify the token of a WebSocket; on failure report it and close the socket."""
     try:
-        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=["HS256"])
-        user_id = payload.get("sub") or payload.get("user_id")
+        payload = await token_verifier.verify(token)
+        user_id = payload.get("user_id")
         
         if not user_id:
             error_msg = json.dumps({"type": "error", "error": "Token inválido"})
             await websocket.send_text(error_msg)
             await websocket.close(code=4001)
-            return
+            return None
+        return user_id
             
     except jwt.ExpiredSignatureError:
         error_msg = json.dumps({"type": "error", "error": "Token expirado"})
         await websocket.send_text(error_msg)
         await websocket.close(code=4001)
-        return
+        return None
     except jwt.InvalidTokenError:
         error_msg = json.dumps({"type": "error", "error": "Token inválido"})
         await websocket.send_text(error_msg)
         await websocket.close(code=4001)
+        return None
+    except KeySetUnavailable:
+        error_msg = json.dumps({"type": "error", "error": "Servicio de autenticación no disponible"})
+        await websocket.send_text(error_msg)
+        await websocket.close(code=1011)
+        return None
+
+
+async def _forward_events(websocket: WebSocket, events: asyncio.Queue):
+    """Push gateway events (matches, dismatches, unread changes) to the client."""
+    try:
+        while True:
+            event = await events.get()
+            await websocket.send_text(json.dumps(event))
+    except Exception:
+        pass
+
+
+async def _run_until_first_done(*coros):
+    """Run the relay loops and stop all of them as soon as one side finishes."""
+    tasks = [asyncio.ensure_future(c) for c in coros]
+    try:
+        await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+@router.websocket("/ws/{token}")
+async def websocket_proxy(websocket: WebSocket, token: str):
+
+    await websocket.accept()
+    
+    user_id = await _authenticate_websocket(websocket, token)
+    if not user_id:
         return
    
-    try:
-        async with httpx.AsyncClient() as client:
-            match_response = await client.get(
-                f"{settings.MATCHING_SERVICE_URL}/matching/relationships/user/{user_id}/active"
-            )
-            
-            if match_response.status_code != 200:
+    # Both setup calls share one budget; the relay itself is long-lived.
+    with scoped_deadline(settings.DEFAULT_ROUTE_TIMEOUT):
+        try:
+            try:
+                relationship = await relationship_cache.active(user_id)
+            except RelationshipLookupError:
                 error_msg = json.dumps({"type": "error", "error": "No tienes un match activo"})
                 await websocket.send_text(error_msg)
                 await websocket.close(code=4003)
                 return
-            
-            match_data = match_response.json()
-            if not match_data.get("has_active_match"):
+        
+            if not relationship.has_active_match:
                 error_msg = json.dumps({"type": "error", "error": "No tienes un match activo para chatear"})
                 await websocket.send_text(error_msg)
                 await websocket.close(code=4003)
                 return
-            
-            relationship_id = match_data.get("relationship_id")
+        
+            relationship_id = relationship.relationship_id
             if not relationship_id:
                 error_msg = json.dumps({"type": "error", "error": "Relationship ID no encontrado"})
                 await websocket.send_text(error_msg)
                 await websocket.close(code=4003)
                 return
-    except Exception as e:
-        error_msg = json.dumps({"type": "error", "error": f"Error verificando match: {str(e)}"})
-        await websocket.send_text(error_msg)
-        await websocket.close(code=1011)
-        return
-    
+        except Exception as e:
+            error_msg = json.dumps({"type": "error", "error": f"Error verificando match: {str(e)}"})
+            await websocket.send_text(error_msg)
+            await websocket.close(code=1011)
+            return
 
-    try:
-        async with httpx.AsyncClient() as client:
-            partner_id = match_data.get("partner_id")
+        partner_id = relationship.partner_id
+        chat_id = None
+        try:
+            client = get_client()
             chat_create_response = await client.post(
                 f"{settings.CHAT_SERVICE_URL}/internal/chats/create",
                 params={
@@ -192,25 +310,65 @@ async def websocket_proxy(websocket: WebSocket, token: str):
                     "user2_id": partner_id
                 }
             )
-    except Exception:
-        pass 
+            if chat_create_response.status_code in (200, 201):
+                chat_id = _chat_id(chat_create_response.json())
+        except Exception:
+            pass
+
+        if chat_id is None:
+            # Resolved once here so every unread_changed event carries it.
+            try:
+                res = await idempotent_get(
+                    f"{settings.CHAT_SERVICE_URL}/chats/by-relationship/{relationship_id}",
+                    route="chat.by_relationship",
+                    params={"user_id": user_id},
+                )
+                if res.status_code == 200:
+                    chat_id = _chat_id(res.json())
+            except Exception:
+                pass
     
 
-    chat_ws_url = settings.CHAT_SERVICE_URL.replace("http://", "ws://").replace("https://", "wss://")
+    # Both participants of a relationship land on the same chat instance
+    chat_endpoint = registry.pick_sticky(settings.CHAT_SERVICE_URL, relationship_id)
+    # Like BalancingTransport: only the origin changes, the path prefix stays.
+    chat_base_url = httpx.URL(settings.CHAT_SERVICE_URL).copy_with(
+        scheme=chat_endpoint.url.scheme, host=chat_endpoint.url.host, port=chat_endpoint.url.port
+    )
+    chat_ws_url = str(chat_base_url).rstrip("/").replace("http://", "ws://").replace("https://", "wss://")
     chat_ws_url = f"{chat_ws_url}/ws/{user_id}/{relationship_id}"
     
-    chat_ws = None
+    # Imported here so loading the gateway does not pay for the websockets client
+    import websockets
+
+    async def connect_upstream():
+        try:
+            chat_ws = await websockets.connect(chat_ws_url, open_timeout=settings.UPSTREAM_WS_CONNECT_TIMEOUT)
+        except (OSError, asyncio.TimeoutError):
+            chat_endpoint.failed()
+            raise
+        chat_endpoint.succeeded()
+        return chat_ws
+
+    session = None
+    outbound = None
+    events = event_bus.subscribe(user_id)
     
     try:
        
-        chat_ws = await websockets.connect(chat_ws_url)
+        # Every device of the user in this chat shares one upstream socket
+        session, outbound = await chat_sessions.join(user_id, relationship_id, connect_upstream)
         
         async def forward_to_chat():
      
             try:
                 while True:
                     data = await websocket.receive_text()
-                    await chat_ws.send(data)
+                    await session.send(data)
+                    # The upstream echo is not guaranteed (nor seen by other gateways).
+                    if chat_id is not None:
+                        message_cache.invalidate(chat_id)
+                    _publish_unread_changed(partner_id, chat_id, relationship_id, None)
             except WebSocketDisconnect:
                 pass
             except Exception:
@@ -219,16 +377,22 @@ async def websocket_proxy(websocket: WebSocket, token: str):
         async def forward_to_client():
        
             try:
-                async for message in chat_ws:
+                while True:
+                    message = await outbound.get()
+                    if message is None:
+                        return
+                    if message is CLIENT_TOO_SLOW:
+                        await websocket.close(code=1013)
+                        return
                     await websocket.send_text(message)
             except Exception:
                 pass
         
        
-        await asyncio.gather(
+        await _run_until_first_done(
             forward_to_chat(),
             forward_to_client(),
-            return_exceptions=True
+            _forward_events(websocket, events),
         )
         
     except websockets.exceptions.InvalidStatusCode as e:
@@ -244,5 +408,36 @@ async def websocket_proxy(websocket: WebSocket, token: str):
             pass
         await websocket.close(code=1011)
     finally:
-        if chat_ws:
-            await chat_ws.close()
+        event_bus.unsubscribe(user_id, events)
+        if session is not None:
+            chat_sessions.leave(session, outbound)
+
+
+@router.websocket("/ws/{token}/events")
+async def websocket_events(websocket: WebSocket, token: str):
+    """
+    Event-only channel for clients without an active chat (e.g. waiting for
+    a match). Receives the same gateway events multiplexed into `/ws/{token}`.
+    """
+    await websocket.accept()
+
+    user_id = await _authenticate_websocket(websocket, token)
+    if not user_id:
+        return
+
+    events = event_bus.subscribe(user_id)
+
+    async def wait_for_disconnect():
+        try:
+            while True:
+                await websocket.receive_text()
+        except Exception:
+            pass
+
+    try:
+        await _run_until_first_done(
+            wait_for_disconnect(),
+            _forward_events(websocket, events),
+        )
+    finally:
+        event_bus.unsubscribe(user_id, events)
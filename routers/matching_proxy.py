@@ -1,13 +1,56 @@
 from fastapi import APIRouter, HTTPException, Depends, Query
+from fastapi.responses import JSONResponse
 from core.config import settings
 from core.security import get_current_user
+from core.events import event_bus, EVENT_MATCH_CREATED, EVENT_DISMATCH
+from core.upstream import get_client
+from core.models import Profile
+from core.json_stream import iter_json_items
+from core.exclusions import exclusion_cache, ExclusionLookupError, encode_delta_varint, DELTA_VARINT_ENCODING
+from core.swipe_buffer import swipe_buffer, SwipeBufferFull, is_match_critical, send_swipe
+from core.relationship_cache import relationship_cache, RelationshipLookupError
 import httpx
+import json
 import random
 
 router = APIRouter(prefix="/matching", tags=["Matching"])
 
-# httpx default timeout is quite small for endpoints that may do heavier DB work
-HTTP_TIMEOUT = httpx.Timeout(20.0)
+
+def _swiped_user_id(swipe_data: dict):
+    for key in ("swiped_user_id", "target_user_id", "swiped_id", "target_id"):
+        if swipe_data.get(key) is not None:
+            return swipe_data[key]
+    return None
+
+
+def _lookup_error(e: RelationshipLookupError) -> HTTPException:
+    try:
+        error_detail = e.response.json()
+    except Exception:
+        error_detail = e.response.text or "Unknown error from matching service"
+    return HTTPException(status_code=e.response.status_code, detail=error_detail)
+
+
+def _publish_swipe_events(user_id: int, swipe_data: dict, result: dict):
+    """Notify both users over the event channel when a swipe created a match."""
+    if not isinstance(result, dict) or not (result.get("match") or result.get("is_match")):
+        return
+    partner_id = result.get("partner_id") or _swiped_user_id(swipe_data)
+    relationship_id = result.get("relationship_id")
+    event_bus.publish(user_id, EVENT_MATCH_CREATED, relationship_id=relationship_id, partner_id=partner_id)
+    event_bus.publish(partner_id, EVENT_MATCH_CREATED, relationship_id=relationship_id, partner_id=user_id)
+
+
+def _publish_dismatch_events(user_id: int, relationship_id: int, result: dict):
+    partner_id = None
+    if isinstance(result, dict):
+        partner_id = result.get("partner_id")
+        if partner_id is None:
+            users = {result.get("user1_id"), result.get("user2_id")} - {None, user_id}
+            partner_id = next(iter(users), None)
+    event_bus.publish(user_id, EVENT_DISMATCH, relationship_id=relationship_id, partner_id=partner_id)
+    event_bus.publish(partner_id, EVENT_DISMATCH, relationship_id=relationship_id, partner_id=user_id)
+    return partner_id
 
 
 @router.get("/potential")
@@ -18,70 +61,77 @@ async def get_potential_matches(
     user_id = payload["user_id"]
     
     try:
-        async with httpx.AsyncClient(timeout=HTTP_TIMEOUT) as client:
+        client = get_client()
            
-            current_user_response = await client.get(
-                f"{settings.USER_SERVICE_URL}/user/profile",
-                params={"user_id": user_id}
-            )
-            
-            if current_user_response.status_code != 200:
-                raise HTTPException(status_code=current_user_response.status_code, detail="Error getting current user profile")
-            
-            current_user = current_user_response.json()
-            
+        current_user_response = await client.get(
+            f"{settings.USER_SERVICE_URL}/user/profile",
+            params={"user_id": user_id}
+        )
+        
+        if current_user_response.status_code != 200:
+            raise HTTPException(status_code=current_user_response.status_code, detail="Error getting current user profile")
+        
+        current_user = current_user_response.json()
+        
            
-            excluded_response = await client.get(
-                f"{settings.MATCHING_SERVICE_URL}/matching/excluded-users/{user_id}"
-            )
-            
-            if excluded_response.status_code != 200:
-                raise HTTPException(status_code=excluded_response.status_code, detail="Error getting excluded users")
-            
-            excluded_data = excluded_response.json()
-            excluded_ids = excluded_data.get("excluded_ids", [])
-            
+        try:
+            excluded_ids = await exclusion_cache.get(user_id)
+        except ExclusionLookupError as e:
+            raise HTTPException(status_code=e.status_code, detail="Error getting excluded users")
+        
+        if settings.EXCLUDED_IDS_ENCODING == "delta-varint":
+            excluded_field = b',"excluded_ids_encoded":' + json.dumps({
+                "encoding": DELTA_VARINT_ENCODING,
+                "count": len(excluded_ids),
+                "data": encode_delta_varint(excluded_ids),
+            }).encode()
+        else:
+            excluded_field = b',"excluded_ids":' + json.dumps(excluded_ids.tolist()).encode()
+        
           
-            profiles_response = await client.get(
-                f"{settings.USER_SERVICE_URL}/user/profiles"
-            )
-            
-            if profiles_response.status_code != 200:
-                raise HTTPException(status_code=profiles_response.status_code, detail="Error getting profiles")
-            
-            all_profiles = profiles_response.json()
-            
+        profiles_response = await client.get(
+            f"{settings.USER_SERVICE_URL}/user/profiles"
+        )
+        
+        if profiles_response.status_code != 200:
+            raise HTTPException(status_code=profiles_response.status_code, detail="Error getting profiles")
+        
          
-            filter_response = await client.post(
-                f"{settings.MATCHING_SERVICE_URL}/matching/filter-compatible",
-                json={
-                    "current_user": current_user,
-                    "profiles": all_profiles,
-                    "excluded_ids": excluded_ids
-                }
-            )
-            
-            if filter_response.status_code != 200:
-                raise HTTPException(status_code=filter_response.status_code, detail="Error filtering compatible profiles")
+        # The profile list is only relayed to the matching service, so its
+        # raw bytes are spliced into the request instead of being parsed.
+        filter_body = b"".join((
+            b'{"current_user":', json.dumps(current_user).encode(),
+            b',"profiles":', profiles_response.content,
+            excluded_field, b"}",
+        ))
+        del profiles_response
+        filter_response = await client.post(
+            f"{settings.MATCHING_SERVICE_URL}/matching/filter-compatible",
+            content=filter_body,
+            headers={"Content-Type": "application/json"},
+        )
+        
+        if filter_response.status_code != 200:
+            raise HTTPException(status_code=filter_response.status_code, detail="Error filtering compatible profiles")
+        
+        filtered_data = filter_response.json()
+        filtered_profiles = filtered_data.get("profiles", [])
+        
+           
+        if filtered_profiles:
             
-            filtered_data = filter_response.json()
-            filtered_profiles = filtered_data.get("profiles", [])
+            top_n = min(5, len(filtered_profiles))
+            chosen = random.choice(filtered_profiles[:top_n])
+            return {
+                "profiles": [chosen],
+                "count": filtered_data.get("count", len(filtered_profiles))
+            }
+        else:
+            return {
+                "profiles": [],
+                "count": 0
+            }
             
-           
-            if filtered_profiles:
-                
-                top_n = min(5, len(filtered_profiles))
-                chosen = random.choice(filtered_profiles[:top_n])
-                return {
-                    "profiles": [chosen],
-                    "count": filtered_data.get("count", len(filtered_profiles))
-                }
-            else:
-                return {
-                    "profiles": [],
-                    "count": 0
-                }
-                
     except httpx.RequestError as e:
         raise HTTPException(status_code=503, detail=f"Service unavailable: {str(e)}")
 
@@ -93,14 +143,20 @@ async def swipe_user(
 ):
 
     user_id = payload["user_id"]
+
+    if settings.SWIPE_ASYNC_ENABLED:
+        if not is_match_critical(swipe_data):
+            try:
+                await swipe_buffer.submit(user_id, swipe_data)
+            except SwipeBufferFull:
+                raise HTTPException(status_code=503, detail="Matching service unavailable: swipe queue full")
+            exclusion_cache.add(user_id, _swiped_user_id(swipe_data))
+            return JSONResponse(status_code=202, content={"queued": True, "match": False})
+        # Keep the order of this user's swipes before asking for a match result.
+        await swipe_buffer.flush_user(user_id)
     
     try:
-        async with httpx.AsyncClient() as client:
-            res = await client.post(
-                f"{settings.MATCHING_SERVICE_URL}/matching/swipe",
-                params={"current_user_id": user_id},
-                json=swipe_data
-            )
+        res = await send_swipe(user_id, swipe_data)
         
         if res.status_code not in [200, 201]:
             try:
@@ -109,10 +165,16 @@ async def swipe_user(
                 error_detail = res.text or "Unknown error from matching service"
             raise HTTPException(status_code=res.status_code, detail=error_detail)
         
-        return res.json()
+        result = res.json()
     except httpx.RequestError as e:
         raise HTTPException(status_code=503, detail=f"Matching service unavailable: {str(e)}")
 
+    partner_id = result.get("partner_id") if isinstance(result, dict) else None
+    relationship_cache.invalidate(user_id, partner_id or _swiped_user_id(swipe_data))
+    exclusion_cache.add(user_id, _swiped_user_id(swipe_data))
+    _publish_swipe_events(user_id, swipe_data, result)
+    return result
+
 
 @router.get("/relationships/check")
 async def check_relationship(
@@ -121,20 +183,10 @@ async def check_relationship(
 ):
 
     try:
-        async with httpx.AsyncClient() as client:
-            res = await client.get(
-                f"{settings.MATCHING_SERVICE_URL}/matching/relationships/check",
-                params={"user1_id": user1_id, "user2_id": user2_id}
-            )
-        
-        if res.status_code != 200:
-            try:
-                error_detail = res.json()
-            except:
-                error_detail = res.text or "Unknown error from matching service"
-            raise HTTPException(status_code=res.status_code, detail=error_detail)
-        
-        return res.json()
+        relationship = await relationship_cache.between(user1_id, user2_id)
+        return relationship.to_check_dict()
+    except RelationshipLookupError as e:
+        raise _lookup_error(e)
     except httpx.RequestError as e:
         raise HTTPException(status_code=503, detail=f"Matching service unavailable: {str(e)}")
 
@@ -145,19 +197,10 @@ async def get_active_relationship(user_id: int):
     Obtiene la relación activa (match) de un usuario.
     """
     try:
-        async with httpx.AsyncClient() as client:
-            res = await client.get(
-                f"{settings.MATCHING_SERVICE_URL}/matching/relationships/user/{user_id}/active"
-            )
-        
-        if res.status_code != 200:
-            try:
-                error_detail = res.json()
-            except:
-                error_detail = res.text or "Unknown error from matching service"
-            raise HTTPException(status_code=res.status_code, detail=error_detail)
-        
-        return res.json()
+        relationship = await relationship_cache.active(user_id)
+        return relationship.to_dict()
+    except RelationshipLookupError as e:
+        raise _lookup_error(e)
     except httpx.RequestError as e:
         raise HTTPException(status_code=503, detail=f"Matching service unavailable: {str(e)}")
 
@@ -170,29 +213,35 @@ async def dismatch(
 
     user_id = payload["user_id"]
     try:
-        async with httpx.AsyncClient(timeout=HTTP_TIMEOUT) as client:
-            res = await client.post(
-                f"{settings.MATCHING_SERVICE_URL}/matching/relationships/{relationship_id}/dismatch",
-                params={"current_user_id": user_id},
-            )
-
-            if res.status_code != 200:
-                try:
-                    error_detail = res.json()
-                except Exception:
-                    error_detail = res.text or "Unknown error from matching service"
-                raise HTTPException(status_code=res.status_code, detail=error_detail)
+        client = get_client()
+        res = await client.post(
+            f"{settings.MATCHING_SERVICE_URL}/matching/relationships/{relationship_id}/dismatch",
+            params={"current_user_id": user_id},
+        )
 
-            # Deactivate chat best-effort
+        if res.status_code != 200:
             try:
-                await client.post(
-                    f"{settings.CHAT_SERVICE_URL}/internal/chats/deactivate",
-                    params={"relationship_id": relationship_id},
-                )
+                error_detail = res.json()
             except Exception:
-                pass
+                error_detail = res.text or "Unknown error from matching service"
+            raise HTTPException(status_code=res.status_code, detail=error_detail)
+
+        # Deactivate chat best-effort
+        try:
+            await client.post(
+                f"{settings.CHAT_SERVICE_URL}/internal/chats/deactivate",
+                params={"relationship_id": relationship_id},
+            )
+        except Exception:
+            pass
 
-            return res.json()
+        result = res.json()
+        partner_id = _publish_dismatch_events(user_id, relationship_id, result)
+        relationship_cache.invalidate(user_id, partner_id, relationship_id=relationship_id)
+        exclusion_cache.invalidate(user_id)
+        if partner_id is not None:
+            exclusion_cache.invalidate(partner_id)
+        return result
     except httpx.RequestError as e:
         raise HTTPException(status_code=503, detail=f"Service unavailable: {str(e)}")
 
@@ -202,34 +251,34 @@ async def connections(payload: dict = Depends(get_current_user)):
  
     user_id = payload["user_id"]
     try:
-        async with httpx.AsyncClient(timeout=HTTP_TIMEOUT) as client:
-            rel_res = await client.get(
-                f"{settings.MATCHING_SERVICE_URL}/matching/connections/{user_id}"
-            )
-            if rel_res.status_code != 200:
-                raise HTTPException(status_code=rel_res.status_code, detail="Error getting connections")
-            partner_ids = rel_res.json().get("partners", [])
+        client = get_client()
+        rel_res = await client.get(
+            f"{settings.MATCHING_SERVICE_URL}/matching/connections/{user_id}"
+        )
+        if rel_res.status_code != 200:
+            raise HTTPException(status_code=rel_res.status_code, detail="Error getting connections")
+        partner_ids = rel_res.json().get("partners", [])
 
-            profiles_res = await client.get(f"{settings.USER_SERVICE_URL}/user/profiles")
+        wanted = set(partner_ids)
+        by_id = {}
+        async with client.stream("GET", f"{settings.USER_SERVICE_URL}/user/profiles") as profiles_res:
             if profiles_res.status_code != 200:
                 raise HTTPException(status_code=profiles_res.status_code, detail="Error getting profiles")
-            profiles = profiles_res.json()
-            by_id = {p["id"]: p for p in profiles}
-
-            connections = []
-            for pid in partner_ids:
-                p = by_id.get(pid)
-                if not p:
-                    continue
-                photo = None
-                imgs = p.get("images") or []
-                if imgs:
-                    photo = imgs[0]
-                connections.append(
-                    {"user_id": pid, "username": p.get("username"), "photo_url": photo}
-                )
-
-            return {"connections": connections, "count": len(connections)}
+            # Only the partners' profiles are kept while the list streams in.
+            async for p in iter_json_items(profiles_res.aiter_bytes()):
+                if p["id"] in wanted:
+                    by_id[p["id"]] = Profile.from_upstream(p)
+
+        connections = []
+        for pid in partner_ids:
+            p = by_id.get(pid)
+            if not p:
+                continue
+            connections.append(
+                {"user_id": pid, "username": p.username, "photo_url": p.photo_url}
+            )
+
+        return {"connections": connections, "count": len(connections)}
     except httpx.RequestError as e:
         raise HTTPException(status_code=503, detail=f"Service unavailable: {str(e)}")
 
@@ -1,6 +1,13 @@
 from fastapi import APIRouter, HTTPException, Depends, UploadFile, File
+from fastapi.responses import JSONResponse, Response
 from core.config import settings
 from core.security import require_incomplete_profile, get_current_user
+from core.resilience import idempotent_get
+from core.upstream import get_client
+from core.outbox import register as outbox_handler, PermanentFailure
+from core.saga import Saga
+from core.profile_cache import profile_cache
+from core.exclusions import exclusion_cache
 from schemas import ProfileComplete, ProfileCompleteResponse
 import httpx
 
@@ -9,8 +16,7 @@ router = APIRouter(prefix="/user", tags=["User"])
 @router.get("/complete_profile", dependencies=[Depends(require_incomplete_profile)])
 async def get_profile_options():
     try:
-        async with httpx.AsyncClient() as client:
-            res = await client.get(f"{settings.USER_SERVICE_URL}/user/complete_profile")
+        res = await idempotent_get(f"{settings.USER_SERVICE_URL}/user/complete_profile", route="user.options")
 
         if res.status_code != 200:
             try:
@@ -28,8 +34,7 @@ async def get_profile_options():
 async def get_profile_options_any(payload: dict = Depends(get_current_user)):
 
     try:
-        async with httpx.AsyncClient() as client:
-            res = await client.get(f"{settings.USER_SERVICE_URL}/user/complete_profile")
+        res = await idempotent_get(f"{settings.USER_SERVICE_URL}/user/complete_profile", route="user.options")
 
         if res.status_code != 200:
             try:
@@ -42,70 +47,107 @@ async def get_profile_options_any(payload: dict = Depends(get_current_user)):
     except httpx.RequestError as e:
         raise HTTPException(status_code=503, detail=f"User service unavailable: {str(e)}")
 
+@outbox_handler("auth.complete_profile")
+async def mark_auth_profile_complete(payload: dict) -> dict:
+    """Flip `complete_profile` in the auth service and get the refreshed token.
+
+    Transport errors and 5xx answers are retried by the outbox; a 4xx (unknown
+    user, validation error) will not change on retry, so it is terminal.
+    """
+    res = await get_client().patch(
+        f"{settings.AUTH_SERVICE_URL}/auth/users/{payload['user_id']}/complete_profile"
+    )
+    if 400 <= res.status_code < 500:
+        raise PermanentFailure(f"Auth service answered {res.status_code}: {res.text[:200]}")
+    if res.status_code != 200:
+        raise RuntimeError(f"Auth service answered {res.status_code}: {res.text[:200]}")
+    return res.json()
+
+
 @router.post("/complete_profile", response_model=ProfileCompleteResponse)
 async def complete_profile(data: ProfileComplete, payload: dict = Depends(require_incomplete_profile)):
+    """
+    Create the profile (critical step) and update the auth record. The auth
+    update is stored in the outbox first, so if it does not finish within
+    COMPLETE_PROFILE_TOKEN_WAIT it is retried in the background instead of
+    being lost.
+    """
     user_id = payload["user_id"]
     
     profile_data = data.model_dump(mode='json')
     profile_data["user_id"] = user_id
-    
-    try:
-        async with httpx.AsyncClient() as client:
 
-            user_response = await client.post(
-                f"{settings.USER_SERVICE_URL}/user/complete_profile",
-                params={"user_id": user_id},
-                json=profile_data
-            )
+    async def create_profile():
+        user_response = await get_client().post(
+            f"{settings.USER_SERVICE_URL}/user/complete_profile",
+            params={"user_id": user_id},
+            json=profile_data
+        )
 
-            if user_response.status_code != 200:
-                try:
-                    error_detail = user_response.json()
-                except:
-                    error_detail = user_response.text or "Unknown error from user service"
-                raise HTTPException(
-                    status_code=user_response.status_code, 
-                    detail=error_detail
-                )
-
-            profile_result = user_response.json()
-            
-            auth_response = await client.patch(
-                f"{settings.AUTH_SERVICE_URL}/auth/users/{user_id}/complete_profile"
+        if user_response.status_code != 200:
+            try:
+                error_detail = user_response.json()
+            except:
+                error_detail = user_response.text or "Unknown error from user service"
+            raise HTTPException(
+                status_code=user_response.status_code, 
+                detail=error_detail
             )
-            
-            if auth_response.status_code != 200:
-                return {
-                    **profile_result,
-                    "warning": "Profile created but token not updated. Please login again.",
-                    "token_updated": False
-                }
-            
-            auth_result = auth_response.json()
-            
-            return {
-                "message": profile_result["message"],
-                "profile_id": profile_result["profile_id"],
-                "access_token": auth_result["access_token"],
-                "token_type": auth_result["token_type"],
-                "complete_profile": auth_result["complete_profile"],
-                "user_id": auth_result["user_id"],
-                "next_endpoint": "/home"
-            }
+
+        profile_cache.invalidate(user_id)
+        return user_response.json()
+
+    saga = (
+        Saga("complete_profile")
+        .step("profile", create_profile)
+        .then("auth.complete_profile", {"user_id": user_id})
+    )
+    try:
+        outcome = await saga.run(inline_timeout=settings.COMPLETE_PROFILE_TOKEN_WAIT)
     except httpx.RequestError as e:
         raise HTTPException(status_code=503, detail=f"Service unavailable: {str(e)}")
 
+    profile_result = outcome.results["profile"]
+    auth_result = outcome.completed.get("auth.complete_profile")
+
+    if "auth.complete_profile" in outcome.failed:
+        return JSONResponse({
+            **profile_result,
+            "warning": "Profile created; the auth service rejected the token update.",
+            "token_updated": False,
+            "token_update_pending": False
+        })
+
+    if auth_result is None:
+        # No new token to hand out yet, so this does not fit ProfileCompleteResponse.
+        return JSONResponse({
+            **profile_result,
+            "warning": "Profile created; token update is pending. Please login again shortly.",
+            "token_updated": False,
+            "token_update_pending": True
+        })
+    
+    return {
+        "message": profile_result["message"],
+        "profile_id": profile_result["profile_id"],
+        "access_token": auth_result["access_token"],
+        "token_type": auth_result["token_type"],
+        "complete_profile": auth_result["complete_profile"],
+        "user_id": auth_result["user_id"],
+        "next_endpoint": "/home"
+    }
+
 @router.get("/profile")
 async def get_user_profile(payload: dict = Depends(get_current_user)):
     """Get the profile of the authenticated user."""
     user_id = payload["user_id"]
     
     try:
-        async with httpx.AsyncClient() as client:
-            res = await client.get(
-                f"{settings.USER_SERVICE_URL}/user/profile",
-                params={"user_id": user_id}
-            )
+        res = await idempotent_get(
+            f"{settings.USER_SERVICE_URL}/user/profile",
+            route="user.profile",
+            params={"user_id": user_id},
+        )
 
         if res.status_code != 200:
             try:
@@ -126,12 +168,12 @@ async def update_own_profile(data: dict, payload: dict = Depends(get_current_use
     """
     user_id = payload["user_id"]
     try:
-        async with httpx.AsyncClient() as client:
-            res = await client.patch(
-                f"{settings.USER_SERVICE_URL}/user/profile",
-                params={"user_id": user_id},
-                json=data,
-            )
+        client = get_client()
+        res = await client.patch(
+            f"{settings.USER_SERVICE_URL}/user/profile",
+            params={"user_id": user_id},
+            json=data,
+        )
 
         if res.status_code != 200:
             try:
@@ -140,6 +182,7 @@ async def update_own_profile(data: dict, payload: dict = Depends(get_current_use
                 error_detail = res.text or "Unknown error from user service"
             raise HTTPException(status_code=res.status_code, detail=error_detail)
 
+        profile_cache.invalidate(user_id)
         return res.json()
     except httpx.RequestError as e:
         raise HTTPException(status_code=503, detail=f"User service unavailable: {str(e)}")
@@ -155,47 +198,49 @@ async def delete_account(payload: dict = Depends(get_current_user)):
     - auth user record
     """
     user_id = payload["user_id"]
-    timeout = httpx.Timeout(30.0)
 
-    async with httpx.AsyncClient(timeout=timeout) as client:
-        results = {}
+    client = get_client()
+    results = {}
 
-        # 1) matching cleanup
-        try:
-            r = await client.delete(
-                f"{settings.MATCHING_SERVICE_URL}/matching/internal/users/delete",
-                params={"user_id": user_id},
-            )
-            results["matching"] = r.json() if r.headers.get("content-type", "").startswith("application/json") else {"status_code": r.status_code}
-        except Exception as e:
-            results["matching"] = {"success": False, "error": str(e)}
-
-        # 2) chat cleanup
-        try:
-            r = await client.delete(
-                f"{settings.CHAT_SERVICE_URL}/internal/users/delete",
-                params={"user_id": user_id},
-            )
-            results["chat"] = r.json() if r.headers.get("content-type", "").startswith("application/json") else {"status_code": r.status_code}
-        except Exception as e:
-            results["chat"] = {"success": False, "error": str(e)}
-
-        # 3) user profile cleanup
-        try:
-            r = await client.delete(
-                f"{settings.USER_SERVICE_URL}/user/profile",
-                params={"user_id": user_id},
-            )
-            results["profile"] = r.json() if r.headers.get("content-type", "").startswith("application/json") else {"status_code": r.status_code}
-        except Exception as e:
-            results["profile"] = {"success": False, "error": str(e)}
+    # 1) matching cleanup
+    try:
+        r = await client.delete(
+            f"{settings.MATCHING_SERVICE_URL}/matching/internal/users/delete",
+            params={"user_id": user_id},
+        )
+        results["matching"] = r.json() if r.headers.get("content-type", "").startswith("application/json") else {"status_code": r.status_code}
+    except Exception as e:
+        results["matching"] = {"success": False, "error": str(e)}
 
-        # 4) auth user cleanup
-        try:
-            r = await client.delete(f"{settings.AUTH_SERVICE_URL}/auth/users/{user_id}")
-            results["auth"] = r.json() if r.headers.get("content-type", "").startswith("application/json") else {"status_code": r.status_code}
-        except Exception as e:
-            results["auth"] = {"success": False, "error": str(e)}
+    exclusion_cache.invalidate(user_id)
+
+    # 2) chat cleanup
+    try:
+        r = await client.delete(
+            f"{settings.CHAT_SERVICE_URL}/internal/users/delete",
+            params={"user_id": user_id},
+        )
+        results["chat"] = r.json() if r.headers.get("content-type", "").startswith("application/json") else {"status_code": r.status_code}
+    except Exception as e:
+        results["chat"] = {"success": False, "error": str(e)}
+
+    # 3) user profile cleanup
+    try:
+        r = await client.delete(
+            f"{settings.USER_SERVICE_URL}/user/profile",
+            params={"user_id": user_id},
+        )
+        results["profile"] = r.json() if r.headers.get("content-type", "").startswith("application/json") else {"status_code": r.status_code}
+    except Exception as e:
+        results["profile"] = {"success": False, "error": str(e)}
+    profile_cache.invalidate(user_id)
+
+    # 4) auth user cleanup
+    try:
+        r = await client.delete(f"{settings.AUTH_SERVICE_URL}/auth/users/{user_id}")
+        results["auth"] = r.json() if r.headers.get("content-type", "").startswith("application/json") else {"status_code": r.status_code}
+    except Exception as e:
+        results["auth"] = {"success": False, "error": str(e)}
 
     # If auth deletion succeeded, consider account deleted even if other services had partial errors.
     if results.get("auth", {}).get("success") is True:
@@ -214,11 +259,11 @@ async def get_profile_by_id(
     Requires authentication, but does NOT force user_id to match the token.
     """
     try:
-        async with httpx.AsyncClient() as client:
-            res = await client.get(
-                f"{settings.USER_SERVICE_URL}/user/profile",
-                params={"user_id": user_id},
-            )
+        res = await idempotent_get(
+            f"{settings.USER_SERVICE_URL}/user/profile",
+            route="user.profile",
+            params={"user_id": user_id},
+        )
 
         if res.status_code != 200:
             try:
@@ -246,12 +291,12 @@ async def upload_profile_image(
         # Create multipart form data
         files = {"file": (file.filename, file_content, file.content_type)}
         
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            res = await client.post(
-                f"{settings.USER_SERVICE_URL}/user/profile/upload-image",
-                params={"user_id": user_id},
-                files=files
-            )
+        client = get_client()
+        res = await client.post(
+            f"{settings.USER_SERVICE_URL}/user/profile/upload-image",
+            params={"user_id": user_id},
+            files=files
+        )
 
         if res.status_code != 200:
             try:
@@ -260,6 +305,7 @@ async def upload_profile_image(
                 error_detail = res.text or "Unknown error from user service"
             raise HTTPException(status_code=res.status_code, detail=error_detail)
 
+        profile_cache.invalidate(user_id)
         return res.json()
     except httpx.RequestError as e:
         raise HTTPException(status_code=503, detail=f"User service unavailable: {str(e)}")
@@ -273,11 +319,11 @@ async def delete_profile_image(
     user_id = payload["user_id"]
     
     try:
-        async with httpx.AsyncClient() as client:
-            res = await client.delete(
-                f"{settings.USER_SERVICE_URL}/user/profile/image/{image_id}",
-                params={"user_id": user_id}
-            )
+        client = get_client()
+        res = await client.delete(
+            f"{settings.USER_SERVICE_URL}/user/profile/image/{image_id}",
+            params={"user_id": user_id}
+        )
 
         if res.status_code != 200:
             try:
@@ -286,6 +332,7 @@ async def delete_profile_image(
                 error_detail = res.text or "Unknown error from user service"
             raise HTTPException(status_code=res.status_code, detail=error_detail)
 
+        profile_cache.invalidate(user_id)
         return res.json()
     except httpx.RequestError as e:
         raise HTTPException(status_code=503, detail=f"User service unavailable: {str(e)}")
@@ -294,8 +341,8 @@ async def delete_profile_image(
 async def get_all_profiles():
     """Get all user profiles (for matching service)."""
     try:
-        async with httpx.AsyncClient() as client:
-            res = await client.get(f"{settings.USER_SERVICE_URL}/user/profiles")
+        client = get_client()
+        res = await client.get(f"{settings.USER_SERVICE_URL}/user/profiles")
 
         if res.status_code != 200:
             try:
@@ -304,7 +351,8 @@ async def get_all_profiles():
                 error_detail = res.text or "Unknown error from user service"
             raise HTTPException(status_code=res.status_code, detail=error_detail)
 
-        return res.json()
+        # Forwarded as bytes: the full list is never parsed into objects here.
+        return Response(content=res.content, media_type="application/json")
     except httpx.RequestError as e:
         raise HTTPException(status_code=503, detail=f"User service unavailable: {str(e)}")
 
@@ -315,11 +363,11 @@ async def get_random_profile(payload: dict = Depends(get_current_user)):
     user_id = payload["user_id"]
     
     try:
-        async with httpx.AsyncClient() as client:
-            res = await client.get(
-                f"{settings.USER_SERVICE_URL}/user/profiles/random",
-                params={"user_id": user_id}
-            )
+        client = get_client()
+        res = await client.get(
+            f"{settings.USER_SERVICE_URL}/user/profiles/random",
+            params={"user_id": user_id}
+        )
 
         if res.status_code != 200:
             try:
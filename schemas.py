@@ -102,6 +102,18 @@ class ChatListResponse(BaseModel):
     total: int
 
 
+class ChatInboxItem(ChatPreviewResponse):
+    """Schema para un chat del inbox con el perfil del partner resuelto."""
+    partner_username: Optional[str] = None
+    partner_photo_url: Optional[str] = None
+
+
+class ChatInboxResponse(BaseModel):
+    """Schema para el inbox agregado de chats."""
+    chats: List[ChatInboxItem]
+    total: int
+
+
 class ChatResponse(BaseModel):
     """Schema de respuesta para un chat."""
     id: int
@@ -0,0 +1,113 @@
+"""Replay traffic captured by the gateway (CAPTURE_FILE) against a gateway.
+
+    python scripts/replay.py traffic.jsonl --target http://localhost:8000 \\
+        --speed 4 --header "Authorization: Bearer <token>"
+
+--speed 1 keeps the original pacing, 4 plays it four times faster and 0
+sends as fast as --concurrency allows. Captures never contain credentials
+or masked fields, so authenticated routes need --header and masked
+request bodies are sent as captured. The summary compares replayed
+statuses with the captured ones and reports latency percentiles.
+"""
+import argparse
+import asyncio
+import json
+import sys
+import time
+
+import httpx
+
+
+def load(path: str) -> list[dict]:
+    with open(path, encoding="utf-8") as f:
+        records = [json.loads(line) for line in f if line.strip()]
+    return sorted(records, key=lambda r: r["ts"])
+
+
+def percentile(values: list[float], p: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+async def send(client: httpx.AsyncClient, record: dict, headers: dict) -> tuple[int | None, float]:
+    url = record["path"] + (f"?{record['query']}" if record.get("query") else "")
+    kwargs = {"headers": {**record.get("headers", {}), **headers}}
+    body = record.get("body") or {}
+    if "json" in body:
+        kwargs["json"] = body["json"]
+    elif "text" in body:
+        kwargs["content"] = body["text"].encode()
+
+    started = time.perf_counter()
+    try:
+        res = await client.request(record["method"], url, **kwargs)
+        status = res.status_code
+    except httpx.HTTPError:
+        status = None
+    return status, (time.perf_counter() - started) * 1000
+
+
+async def replay(records: list[dict], target: str, speed: float, concurrency: int, headers: dict) -> dict:
+    semaphore = asyncio.Semaphore(concurrency)
+    results = []
+
+    async with httpx.AsyncClient(base_url=target, timeout=30.0) as client:
+
+        async def run(record):
+            async with semaphore:
+                status, ms = await send(client, record, headers)
+            results.append((record, status, ms))
+
+        tasks = []
+        first_ts = records[0]["ts"] if records else 0.0
+        started = time.monotonic()
+        for record in records:
+            if speed > 0:
+                delay = (record["ts"] - first_ts) / speed - (time.monotonic() - started)
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            tasks.append(asyncio.create_task(run(record)))
+        await asyncio.gather(*tasks)
+        elapsed = time.monotonic() - started
+
+    latencies = [ms for _, status, ms in results if status is not None]
+    mismatches = [
+        {"method": r["method"], "path": r["path"], "captured": r["status"], "replayed": status}
+        for r, status, _ in results if status != r["status"]
+    ]
+    return {
+        "requests": len(results),
+        "errors": sum(1 for _, status, _ in results if status is None),
+        "status_mismatches": len(mismatches),
+        "elapsed_s": round(elapsed, 2),
+        "p50_ms": round(percentile(latencies, 0.50), 1),
+        "p95_ms": round(percentile(latencies, 0.95), 1),
+        "p99_ms": round(percentile(latencies, 0.99), 1),
+        "mismatch_samples": mismatches[:20],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay captured gateway traffic")
+    parser.add_argument("capture", help="JSONL file written by the gateway (CAPTURE_FILE)")
+    parser.add_argument("--target", default="http://localhost:8000")
+    parser.add_argument("--speed", type=float, default=1.0, help="1 = original rate, 0 = no pacing")
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--header", action="append", default=[], help='Extra header, e.g. "Authorization: Bearer X"')
+    args = parser.parse_args()
+
+    headers = {}
+    for header in args.header:
+        name, _, value = header.partition(":")
+        headers[name.strip()] = value.strip()
+
+    records = load(args.capture)
+    summary = asyncio.run(replay(records, args.target, args.speed, args.concurrency, headers))
+    json.dump(summary, sys.stdout, indent=2)
+    print()
+
+
+if __name__ == "__main__":
+    main()
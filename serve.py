@@ -0,0 +1,57 @@
+"""Serve the gateway with Hypercorn: HTTP/1.1, HTTP/2 and optionally HTTP/3.
+
+    python serve.py
+
+Without SERVE_CERTFILE/SERVE_KEYFILE clients can speak HTTP/1.1 or
+cleartext HTTP/2 (h2c, by upgrade or prior knowledge). With them, TLS
+negotiates h2 via ALPN, and SERVE_QUIC_BIND additionally serves HTTP/3
+(requires `hypercorn[h3]`). `uvicorn main:app` keeps working for plain
+HTTP/1.1.
+
+The gateway logs through the "uvicorn.error" logger, which uvicorn sets up
+itself; under Hypercorn `configure_logging` gives it a handler.
+"""
+import asyncio
+import logging
+import sys
+
+from hypercorn.asyncio import serve
+from hypercorn.config import Config
+
+from core.config import settings
+from main import app
+
+
+def configure_logging():
+    logger = logging.getLogger("uvicorn.error")
+    if logger.handlers:
+        return
+    handler = logging.StreamHandler(sys.stderr)
+    # Same layout as Hypercorn's own error log
+    handler.setFormatter(logging.Formatter(
+        "[%(asctime)s] [%(process)d] [%(levelname)s] %(message)s", "%Y-%m-%d %H:%M:%S %z"
+    ))
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+
+def build_config() -> Config:
+    config = Config()
+    config.bind = list(settings.SERVE_BIND)
+    config.keep_alive_timeout = settings.SERVE_KEEP_ALIVE_TIMEOUT
+    config.keep_alive_max_requests = settings.SERVE_KEEP_ALIVE_MAX_REQUESTS
+    config.graceful_timeout = settings.SERVE_GRACEFUL_TIMEOUT
+    config.h2_max_concurrent_streams = settings.SERVE_H2_MAX_CONCURRENT_STREAMS
+    config.h2_max_inbound_frame_size = settings.SERVE_H2_MAX_INBOUND_FRAME_SIZE
+    if settings.SERVE_CERTFILE and settings.SERVE_KEYFILE:
+        config.certfile = settings.SERVE_CERTFILE
+        config.keyfile = settings.SERVE_KEYFILE
+        config.alpn_protocols = ["h2", "http/1.1"]
+        config.quic_bind = list(settings.SERVE_QUIC_BIND)
+    return config
+
+
+if __name__ == "__main__":
+    configure_logging()
+    asyncio.run(serve(app, build_config()))
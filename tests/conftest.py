@@ -0,0 +1,12 @@
+import os
+import sys
+
+# Settings are required at first use; tests never reach these services.
+os.environ.setdefault("AUTH_SERVICE_URL", "http://auth")
+os.environ.setdefault("USER_SERVICE_URL", "http://user")
+os.environ.setdefault("MATCHING_SERVICE_URL", "http://matching")
+os.environ.setdefault("CHAT_SERVICE_URL", "http://chat")
+os.environ.setdefault("SECRET_KEY", "test-secret")
+os.environ.setdefault("WARMUP_ENABLED", "false")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,80 @@
+import asyncio
+
+import pytest
+
+from core.admission import (
+    AdmissionController, Overloaded, TIER_CRITICAL, TIER_LOW, TIER_NORMAL, route_priority,
+)
+
+
+def test_route_priority_longest_prefix():
+    assert route_priority("/auth/login") == TIER_CRITICAL
+    assert route_priority("/user/profiles") == TIER_LOW
+    assert route_priority("/user/profiles/random") == TIER_NORMAL
+    assert route_priority("/matching/swipe") == TIER_NORMAL
+
+
+def test_freed_slots_go_to_the_most_important_waiter():
+    async def main():
+        controller = AdmissionController(max_in_flight=1, target_delay=10.0, max_wait=5.0)
+        await controller.acquire(TIER_NORMAL)
+        order = []
+
+        async def request(tier, name):
+            await controller.acquire(tier)
+            order.append(name)
+            controller.release()
+
+        tasks = [
+            asyncio.ensure_future(request(TIER_LOW, "low")),
+            asyncio.ensure_future(request(TIER_NORMAL, "normal")),
+            asyncio.ensure_future(request(TIER_CRITICAL, "critical")),
+        ]
+        await asyncio.sleep(0)
+        controller.release()
+        await asyncio.gather(*tasks)
+        return order, controller.in_flight
+
+    order, in_flight = asyncio.run(main())
+    assert order == ["critical", "normal", "low"]
+    assert in_flight == 0
+
+
+@pytest.mark.parametrize("queue_delay, shed", [
+    (0.1, set()),                         # at the target: nobody is shed
+    (0.100001, {TIER_LOW}),               # just past target * 1.0
+    (0.4, {TIER_LOW}),                    # normal's threshold is not exceeded
+    (0.400001, {TIER_LOW, TIER_NORMAL}),  # past target * 4.0
+    (100.0, {TIER_LOW, TIER_NORMAL}),     # critical is never shed
+])
+def test_shedding_thresholds(queue_delay, shed):
+    async def main():
+        controller = AdmissionController(max_in_flight=1, target_delay=0.1, max_wait=0.01)
+        await controller.acquire(TIER_NORMAL)  # saturate
+        rejected_at_once = set()
+        for tier in (TIER_CRITICAL, TIER_NORMAL, TIER_LOW):
+            controller.queue_delay = queue_delay
+            try:
+                await controller.acquire(tier)
+            except Overloaded:
+                # Shed requests fail without waiting out max_wait.
+                if controller.queue_delay == queue_delay:
+                    rejected_at_once.add(tier)
+        return rejected_at_once
+
+    assert asyncio.run(main()) == shed
+
+
+def test_wait_timeout_rejects_without_leaking_slots():
+    async def main():
+        controller = AdmissionController(max_in_flight=1, target_delay=10.0, max_wait=0.01)
+        await controller.acquire(TIER_NORMAL)
+        with pytest.raises(Overloaded) as excinfo:
+            await controller.acquire(TIER_CRITICAL)
+        controller.release()
+        await controller.acquire(TIER_LOW)  # the slot is free again
+        return excinfo.value.retry_after, controller.in_flight
+
+    retry_after, in_flight = asyncio.run(main())
+    assert retry_after >= 1
+    assert in_flight == 1
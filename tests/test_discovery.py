@@ -0,0 +1,36 @@
+from types import SimpleNamespace
+
+import httpx
+
+from core import discovery
+from core.config import settings
+
+
+def _eject(endpoint: discovery.Endpoint) -> float:
+    for _ in range(settings.OUTLIER_CONSECUTIVE_FAILURES):
+        endpoint.failed()
+    return endpoint.ejected_until
+
+
+def test_back_off_grows_for_a_flapping_endpoint(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(discovery, "time", SimpleNamespace(monotonic=lambda: now[0]))
+    endpoint = discovery.Endpoint(httpx.URL("http://matching-1"))
+
+    durations = []
+    for _ in range(3):
+        durations.append(_eject(endpoint) - now[0])
+        now[0] = endpoint.ejected_until + 1
+        endpoint.succeeded()  # one good request after coming back
+    base = settings.OUTLIER_BASE_EJECTION_TIME
+    assert durations == [base, 2 * base, 3 * base]
+
+
+def test_back_off_resets_after_a_long_healthy_period(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(discovery, "time", SimpleNamespace(monotonic=lambda: now[0]))
+    endpoint = discovery.Endpoint(httpx.URL("http://matching-1"))
+
+    _eject(endpoint)
+    now[0] = endpoint.ejected_until + settings.OUTLIER_MAX_EJECTION_TIME + 1
+    assert _eject(endpoint) - now[0] == settings.OUTLIER_BASE_EJECTION_TIME
@@ -0,0 +1,45 @@
+import base64
+from array import array
+
+import pytest
+
+from core.exclusions import _Entry, encode_delta_varint
+
+
+def _decode(data: str) -> list[int]:
+    ids, current, shift, gap = [], 0, 0, 0
+    for byte in base64.b64decode(data):
+        gap |= (byte & 0x7F) << shift
+        shift += 7
+        if not byte & 0x80:
+            current += gap
+            ids.append(current)
+            gap, shift = 0, 0
+    return ids
+
+
+@pytest.mark.parametrize("ids, raw", [
+    ([], b""),
+    ([0], b"\x00"),
+    ([127], b"\x7f"),
+    ([128], b"\x80\x01"),
+    ([300], b"\xac\x02"),
+    ([16383], b"\xff\x7f"),
+    ([16384], b"\x80\x80\x01"),
+    ([5, 6, 134], b"\x05\x01\x80\x01"),  # gaps 5, 1, 128
+])
+def test_varint_boundaries(ids, raw):
+    assert base64.b64decode(encode_delta_varint(array("q", ids))) == raw
+
+
+def test_round_trip_of_large_ids():
+    ids = [1, 2, 2**31 - 1, 2**31, 2**53, 2**63 - 1]
+    assert _decode(encode_delta_varint(array("q", ids))) == ids
+
+
+def test_entry_keeps_ids_sorted_and_unique():
+    entry = _Entry()
+    for user_id in (40, 3, 17, 3, 2**40, 17):
+        entry.add(user_id)
+    assert entry.ids.tolist() == [3, 17, 40, 2**40]
+    assert _decode(encode_delta_varint(entry.ids)) == [3, 17, 40, 2**40]
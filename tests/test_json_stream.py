@@ -0,0 +1,98 @@
+import asyncio
+import json
+
+import httpx
+import pytest
+
+from core import json_stream
+from core.json_stream import ResponseTooLarge, enforce_response_limit, iter_json_items, response_limit
+
+DOCUMENT = {
+    "count": 3,
+    "meta": {"note": "list: [1, 2] \"quoted\" \\ end", "tags": ["a", "]", "}"]},
+    "profiles": [
+        {"id": 1, "name": "Ñandú é中", "score": -1.5e3},
+        {"id": 12345, "bio": "tab\there\nnew line, comma", "tags": []},
+        [],
+        "",
+        0.25,
+        None,
+        True,
+    ],
+    "after": [9, 9],
+}
+
+
+def _collect(chunks, key=None) -> list:
+    async def source():
+        for chunk in chunks:
+            yield chunk
+
+    async def main():
+        return [item async for item in iter_json_items(source(), key=key)]
+
+    return asyncio.run(main())
+
+
+def test_items_survive_every_two_chunk_split():
+    raw = json.dumps(DOCUMENT, ensure_ascii=False).encode()
+    for cut in range(1, len(raw)):
+        assert _collect([raw[:cut], raw[cut:]], key="profiles") == DOCUMENT["profiles"], cut
+
+
+def test_items_survive_one_byte_chunks():
+    raw = json.dumps(DOCUMENT["profiles"], indent=2, ensure_ascii=False).encode()
+    assert _collect([raw[i:i + 1] for i in range(len(raw))]) == DOCUMENT["profiles"]
+
+
+@pytest.mark.parametrize("raw, key, expected", [
+    (b"[]", None, []),
+    (b"  [ 1 , 2 ]  ", None, [1, 2]),
+    (b'{"profiles": []}', "profiles", []),
+    (b'{"other": 1}', "profiles", []),
+    (b"[12, 3]", None, [12, 3]),
+])
+def test_small_documents(raw, key, expected):
+    # Split inside numbers as well: "1|2" must not yield 1 then 2.
+    assert _collect([raw[:2], raw[2:]], key=key) == expected
+
+
+@pytest.mark.parametrize("raw", [b"[1 2]", b"[1,", b'{"profiles" 1}', b'{"x": [1 }'])
+def test_malformed_documents_raise(raw):
+    with pytest.raises(ValueError):
+        _collect([raw], key=None if raw.startswith(b"[") else "x")
+
+
+def _response(path: str, chunks: list[bytes], headers=None) -> httpx.Response:
+    class Stream(httpx.AsyncByteStream):
+        async def __aiter__(self):
+            for chunk in chunks:
+                yield chunk
+
+    request = httpx.Request("GET", f"http://user{path}")
+    return httpx.Response(200, headers=headers or {}, stream=Stream(), request=request)
+
+
+def test_response_limit_uses_the_longest_prefix():
+    assert response_limit("/user/profiles/random") == json_stream.RESPONSE_LIMITS["/user/profiles/random"]
+    assert response_limit("/user/profiles") == json_stream.RESPONSE_LIMITS["/user/profiles"]
+
+
+def test_declared_length_over_the_limit_is_rejected(monkeypatch):
+    monkeypatch.setattr(json_stream, "response_limit", lambda path: 10)
+    response = _response("/user/profile", [b"x" * 11], headers={"content-length": "11"})
+    with pytest.raises(ResponseTooLarge):
+        asyncio.run(enforce_response_limit(response))
+
+
+def test_streamed_body_is_cut_once_it_passes_the_limit(monkeypatch):
+    monkeypatch.setattr(json_stream, "response_limit", lambda path: 10)
+
+    async def read(chunks):
+        response = _response("/user/profile", chunks)
+        await enforce_response_limit(response)
+        return await response.aread()
+
+    assert asyncio.run(read([b"12345", b"67890"])) == b"1234567890"
+    with pytest.raises(ResponseTooLarge):
+        asyncio.run(read([b"12345", b"67890", b"1"]))
@@ -0,0 +1,28 @@
+from core.message_cache import MessageCache
+
+
+def _page(ids, total=None):
+    messages = [
+        {"id": i, "chat_id": 1, "sender_id": 7, "content": f"m{i}", "created_at": "2024-01-01T00:00:00", "is_read": False}
+        for i in ids
+    ]
+    return {"messages": messages, "total": len(ids) if total is None else total}
+
+
+def test_fresh_page_replaces_a_larger_cached_one():
+    cache = MessageCache(max_chats=10, max_messages_per_chat=50)
+    cache.store_page(1, 7, _page([5, 4, 3, 2, 1]))
+    # Messages were deleted upstream: the shorter page is the truth now.
+    cache.store_page(1, 8, _page([5, 4], total=2))
+
+    page = cache.get_page(1, 7, page_size=20)
+    assert [m["id"] for m in page["messages"]] == [5, 4]
+    assert page["total"] == 2
+    assert cache.get_page(1, 8, page_size=20) is not None
+
+
+def test_invalidate_drops_the_page():
+    cache = MessageCache(max_chats=10, max_messages_per_chat=50)
+    cache.store_page(1, 7, _page([2, 1]))
+    cache.invalidate(1)
+    assert cache.get_page(1, 7, page_size=20) is None
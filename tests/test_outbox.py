@@ -0,0 +1,38 @@
+import asyncio
+import sqlite3
+
+import pytest
+
+from core.outbox import Outbox, PermanentFailure, register
+
+
+@register("test.rejected")
+async def _rejected(payload: dict):
+    raise PermanentFailure("Auth service answered 404")
+
+
+@register("test.unavailable")
+async def _unavailable(payload: dict):
+    raise RuntimeError("Auth service answered 503")
+
+
+def _row(path: str, job_id: int):
+    with sqlite3.connect(path) as conn:
+        return conn.execute("SELECT attempts, dead FROM outbox WHERE id = ?", (job_id,)).fetchone()
+
+
+@pytest.mark.parametrize("kind, expected", [
+    ("test.rejected", (1, 1)),     # 4xx: dead-lettered at once
+    ("test.unavailable", (1, 0)),  # 5xx: retried later
+])
+def test_permanent_failures_are_not_retried(tmp_path, kind, expected):
+    path = str(tmp_path / "outbox.db")
+
+    async def main():
+        outbox = Outbox(path)
+        job_id = await outbox.enqueue(kind, {"user_id": 1})
+        await outbox.process_due()
+        return job_id
+
+    job_id = asyncio.run(main())
+    assert _row(path, job_id) == expected
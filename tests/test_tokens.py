@@ -0,0 +1,48 @@
+import asyncio
+
+import jwt
+import pytest
+
+from core.tokens import KeySet, KeySetUnavailable
+
+JWKS = {"keys": [{"kty": "oct", "kid": "k1", "k": "c2VjcmV0"}]}
+
+
+def _key_set(monkeypatch, load):
+    key_set = KeySet(url="http://auth/.well-known/jwks.json", path=None, refresh_interval=300)
+    calls = []
+
+    async def counted():
+        calls.append(1)
+        return load()
+
+    monkeypatch.setattr(key_set, "_load", counted)
+    return key_set, calls
+
+
+def test_failed_loads_are_rate_limited(monkeypatch):
+    def down():
+        raise OSError("auth service down")
+
+    key_set, calls = _key_set(monkeypatch, down)
+
+    async def main():
+        for kid in ("a", "b", "c", None):
+            with pytest.raises(KeySetUnavailable):
+                await key_set.get(kid)
+
+    asyncio.run(main())
+    assert len(calls) == 1
+
+
+def test_unknown_kids_refresh_at_most_once(monkeypatch):
+    key_set, calls = _key_set(monkeypatch, lambda: JWKS)
+
+    async def main():
+        assert (await key_set.get("k1")).key_id == "k1"
+        for kid in ("forged-1", "forged-2", "forged-3"):
+            with pytest.raises(jwt.InvalidTokenError):
+                await key_set.get(kid)
+
+    asyncio.run(main())
+    assert len(calls) == 1
@@ -0,0 +1,99 @@
+import asyncio
+import json
+
+import httpx
+
+from core import traffic
+from core.config import settings
+
+
+def _run_capture(path: str, body: dict) -> dict:
+    entries = []
+
+    class Log:
+        def write(self, entry):
+            entries.append(entry)
+
+    async def app(scope, receive, send):
+        await receive()
+        await send({"type": "http.response.start", "status": 200,
+                    "headers": [(b"content-type", b"application/json")]})
+        await send({"type": "http.response.body", "body": b'{"access_token": "abc"}'})
+
+    async def main():
+        raw = json.dumps(body).encode()
+        messages = [{"type": "http.request", "body": raw, "more_body": False}]
+
+        async def receive():
+            return messages.pop(0)
+
+        async def send(message):
+            pass
+
+        scope = {
+            "type": "http", "method": "POST", "path": path, "query_string": b"",
+            "headers": [(b"content-type", b"application/json")],
+        }
+        await traffic.CaptureMiddleware(app, ("/auth",))(scope, receive, send)
+
+    original = traffic.capture_log
+    traffic.capture_log = Log()
+    try:
+        asyncio.run(main())
+    finally:
+        traffic.capture_log = original
+    return entries[0]
+
+
+def test_capture_masks_login_credentials(monkeypatch):
+    monkeypatch.setattr(settings, "CAPTURE_ENABLED", True)
+    monkeypatch.setattr(settings, "CAPTURE_SAMPLE_RATE", 1.0)
+
+    entry = _run_capture("/auth/login", {
+        "email": "a@b.c", "password": "hunter2", "turnstile_token": "cf-token", "remember": True,
+    })
+
+    captured = entry["body"]["json"]
+    assert captured["turnstile_token"] == traffic.MASK
+    assert captured["password"] == traffic.MASK
+    assert captured["email"] == traffic.MASK
+    assert captured["remember"] is True
+    assert entry["response"]["json"]["access_token"] == traffic.MASK
+
+
+def test_sanitize_masks_keys_containing_sensitive_words():
+    data = {"api_key": "k", "client_secret": "s", "Reset-Token": "t", "profile": {"old_password": "p"}, "name": "x"}
+    assert traffic.sanitize(data) == {
+        "api_key": "***", "client_secret": "***", "Reset-Token": "***",
+        "profile": {"old_password": "***"}, "name": "x",
+    }
+    assert traffic._sanitize_query("user_id=1&turnstile_token=abc") == "user_id=1&turnstile_token=%2A%2A%2A"
+
+
+def test_shadow_hook_does_not_read_streamed_bodies(monkeypatch):
+    mirrored = []
+    monkeypatch.setattr(traffic.shadow, "mirror", lambda *args: mirrored.append(args))
+
+    class Chunks(httpx.AsyncByteStream):
+        def __init__(self):
+            self.read = 0
+
+        async def __aiter__(self):
+            for _ in range(3):
+                self.read += 1
+                yield b"[1]"
+
+    async def main():
+        chunks = Chunks()
+        request = httpx.Request("GET", "http://user/user/profiles")
+        request.extensions["shadow"] = ("http://candidate/user/profiles", 0.0)
+        response = httpx.Response(200, stream=chunks, request=request)
+
+        await traffic.mirror_shadow(response)
+        assert chunks.read == 0 and not mirrored
+
+        await response.aclose()  # the caller stopped without reading
+        return chunks
+
+    asyncio.run(main())
+    assert mirrored[0][3] is None  # status and latency only